@@ -4,22 +4,8 @@ import time
 
 
 def default_uniform(grids: list[Grid]):
-    valid = []
-    currboard = grids[-1].copy()
-    explore_up, explore_left, explore_down, explore_right = [currboard.copy() for i in range(4)]
-    explore_up.up()
-    explore_left.left()
-    explore_down.down()
-    explore_right.right()
-    
-    if explore_up != currboard:
-        valid.append('w')
-    if explore_left != currboard:
-        valid.append('a')
-    if explore_down != currboard:
-        valid.append('s')
-    if explore_right != currboard:
-        valid.append('d')
+    currboard = grids[-1]
+    valid = currboard.legal_moves()
     print(valid)
     print(currboard)
     direction = random.choice(valid)
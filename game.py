@@ -1,15 +1,28 @@
 from __future__ import print_function
-import tkinter as tk
-import tkinter.messagebox as messagebox
+try:
+    import tkinter as tk
+    import tkinter.messagebox as messagebox
+except ImportError:
+    # Headless interpreters built without Tk can still run Game(panel=None)
+    tk = messagebox = None
 
 import sys
 import math
+import time
 import random
+from collections import deque
+
+BITSET_TILE_BITS = 5
 
 
 class Grid:
     '''The data structure representation of the 2048 game.
     '''
+    DIRECTIONS = ('w', 'a', 's', 'd')
+    SLIDE_CACHE_SIZE = 1 << 16
+    _LINES = {}
+    _SLIDES = {}
+
     def __init__(self, n, cells=None, compressed=False, merged=False, moved=False, current_score=0, is_copy=False):
         self.size = n
         if cells is None:
@@ -23,6 +36,7 @@ class Grid:
         self.moved = moved
         self.current_score = current_score
         self.is_copy = is_copy
+        self._move_cache = None
 
     def __str__(self):
         return "\n".join([str(row) for row in self.cells])
@@ -38,6 +52,121 @@ class Grid:
         return Grid(self.size, cells=[row.copy() for row in self.cells.copy()], compressed=self.compressed, 
                     merged=self.merged, moved=self.moved, current_score=self.current_score, is_copy=True)
 
+    def snapshot(self):
+        return tuple(value for row in self.cells for value in row)
+
+    def to_bitset(self, bits_per_tile=BITSET_TILE_BITS):
+        '''Packs log2 tile exponents row-major into ``bits_per_tile`` fields,
+        the layout used by the solvers/jw bitset engine.'''
+        mask = (1 << bits_per_tile) - 1
+        bitset = 0
+        for index, value in enumerate(self.snapshot()):
+            if value:
+                exponent = value.bit_length() - 1
+                if exponent > mask:
+                    raise ValueError("Tile {} does not fit in {} bits".format(value, bits_per_tile))
+                bitset |= exponent << (index * bits_per_tile)
+        return bitset
+
+    @classmethod
+    def from_bitset(cls, bitset, n=4, bits_per_tile=BITSET_TILE_BITS):
+        mask = (1 << bits_per_tile) - 1
+        snapshot = []
+        for index in range(n * n):
+            exponent = (bitset >> (index * bits_per_tile)) & mask
+            snapshot.append(1 << exponent if exponent else 0)
+        return cls.from_snapshot(n, snapshot)
+
+    @classmethod
+    def from_snapshot(cls, n, snapshot, current_score=0):
+        cells = [list(snapshot[i * n:(i + 1) * n]) for i in range(n)]
+        return cls(n, cells=cells, current_score=current_score, is_copy=True)
+
+    @classmethod
+    def lines(cls, n, direction):
+        '''Cell coordinates of each line, ordered in the direction tiles slide.'''
+        key = (n, direction)
+        if key not in cls._LINES:
+            if direction == 'a':
+                lines = [[(i, j) for j in range(n)] for i in range(n)]
+            elif direction == 'd':
+                lines = [[(i, j) for j in reversed(range(n))] for i in range(n)]
+            elif direction == 'w':
+                lines = [[(i, j) for i in range(n)] for j in range(n)]
+            elif direction == 's':
+                lines = [[(i, j) for i in reversed(range(n))] for j in range(n)]
+            else:
+                raise ValueError("Unknown direction {!r}".format(direction))
+            cls._LINES[key] = lines
+        return cls._LINES[key]
+
+    @staticmethod
+    def slide_line(values):
+        '''Slides one line towards index 0 without touching the grid.
+
+        Returns the new values, whether the first compress moved a tile,
+        whether anything merged, the score gained and whether the second
+        compress moved a tile, mirroring left_compress/left_merge.
+        '''
+        n = len(values)
+        tiles = [v for v in values if v != 0]
+        compressed = any(values[j] != 0 for j in range(len(tiles), n))
+        row = tiles + [0] * (n - len(tiles))
+
+        merged = False
+        gain = 0
+        for j in range(len(tiles) - 1):
+            if row[j] == row[j + 1] and row[j] != 0:
+                row[j] <<= 1
+                row[j + 1] = 0
+                gain += row[j]
+                merged = True
+
+        if not merged:
+            return row, compressed, False, 0, False
+        tiles = [v for v in row if v != 0]
+        recompressed = any(row[j] != 0 for j in range(len(tiles), n))
+        return tiles + [0] * (n - len(tiles)), compressed, True, gain, recompressed
+
+    @staticmethod
+    def can_slide_line(values):
+        for a, b in zip(values, values[1:]):
+            if (a == 0 and b != 0) or (a != 0 and a == b):
+                return True
+        return False
+
+    def _moves(self):
+        # Legal moves and their results, recomputed only when the board changes
+        key = self.snapshot()
+        if self._move_cache is None or self._move_cache[0] != key:
+            cells = self.cells
+            legal = [
+                d for d in Grid.DIRECTIONS
+                if any(self.can_slide_line([cells[i][j] for i, j in line])
+                       for line in Grid.lines(self.size, d))
+            ]
+            self._move_cache = (key, legal, {})
+        return self._move_cache
+
+    def legal_moves(self):
+        '''Directions ('w', 'a', 's', 'd') that change the board.'''
+        return list(self._moves()[1])
+
+    def move_result(self, direction):
+        '''The Grid that moving in ``direction`` would give, without moving this one.'''
+        _, _, results = self._moves()
+        if direction not in results:
+            cells = [row.copy() for row in self.cells]
+            compressed, merged, moved, gain = self._slide_cells(cells, direction)
+            results[direction] = (tuple(v for row in cells for v in row), compressed, merged, moved, gain)
+
+        snapshot, compressed, merged, moved, gain = results[direction]
+        result = Grid.from_snapshot(self.size, snapshot, self.current_score + gain)
+        result.compressed = compressed
+        result.merged = merged
+        result.moved = moved
+        return result
+
     def random_cell(self):
         cell = random.choice(self.retrieve_empty_cells())
         i = cell[0]
@@ -133,37 +262,102 @@ class Grid:
             print()
         print('-' * 40)
 
+    @classmethod
+    def _slide_cached(cls, line):
+        # Lines repeat constantly within and across games, so slides are
+        # memoised on the line tuple; None marks a line that cannot move
+        try:
+            return cls._SLIDES[line]
+        except KeyError:
+            pass
+        if len(cls._SLIDES) >= cls.SLIDE_CACHE_SIZE:
+            cls._SLIDES.clear()
+        if cls.can_slide_line(line):
+            values, _, merged, gain, recompressed = cls.slide_line(line)
+            result = (values, merged, gain, recompressed)
+        else:
+            result = None
+        cls._SLIDES[line] = result
+        return result
+
+    def _slide_cells(self, cells, direction):
+        # Slides every line of ``cells`` in place and returns the flags and
+        # score gained, matching the compress/merge/compress sequence
+        moved = merged = compressed = False
+        gain = 0
+        n = self.size
+        slide = Grid._slide_cached
+
+        if direction == 'a' or direction == 'd':
+            for row in cells:
+                result = slide(tuple(row) if direction == 'a' else tuple(reversed(row)))
+                if result is None:
+                    continue
+                values, m, g, rc = result
+                row[:] = values if direction == 'a' else values[::-1]
+                moved = True
+                merged = merged or m
+                compressed = compressed or rc
+                gain += g
+        else:
+            order = range(n) if direction == 'w' else range(n - 1, -1, -1)
+            for j in range(n):
+                result = slide(tuple([cells[i][j] for i in order]))
+                if result is None:
+                    continue
+                values, m, g, rc = result
+                for i, value in zip(order, values):
+                    cells[i][j] = value
+                moved = True
+                merged = merged or m
+                compressed = compressed or rc
+                gain += g
+        return compressed, merged, moved, gain
+
+    def move(self, direction):
+        self.compressed, self.merged, self.moved, gain = self._slide_cells(self.cells, direction)
+        self.current_score += gain
+
     def up(self):
-        self.transpose()
-        self.left_compress()
-        self.left_merge()
-        self.moved = self.compressed or self.merged
-        self.left_compress()
-        self.transpose()
+        self.move('w')
 
     def left(self):
-        self.left_compress()
-        self.left_merge()
-        self.moved = self.compressed or self.merged
-        self.left_compress()
+        self.move('a')
 
     def down(self):
-        self.transpose()
-        self.reverse()
-        self.left_compress()
-        self.left_merge()
-        self.moved = self.compressed or self.merged
-        self.left_compress()
-        self.reverse()
-        self.transpose()
+        self.move('s')
 
     def right(self):
-        self.reverse()
-        self.left_compress()
-        self.left_merge()
-        self.moved = self.compressed or self.merged
-        self.left_compress()
-        self.reverse()
+        self.move('d')
+
+
+class GridHistory:
+    '''Bounded, read-only history of boards handed to AIs.
+
+    Boards are kept as flat tuples in a ring buffer of ``depth`` entries
+    (unbounded if None). Indexing builds a fresh Grid, so an AI may move
+    the board it gets back without copying it first.
+    '''
+    def __init__(self, size, depth=None):
+        self.size = size
+        self.snapshots = deque(maxlen=depth)
+        self.scores = deque(maxlen=depth)
+
+    def append(self, grid):
+        self.snapshots.append(grid.snapshot())
+        self.scores.append(grid.current_score)
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Grid.from_snapshot(self.size, self.snapshots[index], self.scores[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
 
 class GamePanel:
@@ -272,10 +466,57 @@ class GamePanel:
                         text=cell_text,
                         bg=bg_color, fg=fg_color)
 
+class PhaseProfiler:
+    '''Wall time and call counts per phase of the AI game loop.'''
+    def __init__(self):
+        self.phases = {}
+        self._last = None
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        # Charges the time since the previous start/lap to `phase`
+        now = time.perf_counter()
+        entry = self.phases.setdefault(phase, [0, 0.0])
+        entry[0] += 1
+        entry[1] += now - self._last
+        self._last = now
+
+    def as_dict(self):
+        total = sum(seconds for _, seconds in self.phases.values())
+        return {
+            phase: {
+                'calls': calls,
+                'time': seconds,
+                'time_per_call': seconds / calls,
+                'share': seconds / total if total else 0.0,
+            }
+            for phase, (calls, seconds) in self.phases.items()
+        }
+
+    def print_report(self):
+        for phase, stats in self.as_dict().items():
+            print('{}: {} calls, {:.4f} s total, {:.2f} us/call, {:.1%} of loop time'.format(
+                phase, stats['calls'], stats['time'], stats['time_per_call'] * 1e6, stats['share']))
+
+
+class InvalidMoveError(RuntimeError):
+    pass
+
+
 class Game:
-    '''The main game class which is the controller of the whole game.'''
+    '''The main game class which is the controller of the whole game.
+
+    With ``panel=None`` the game runs headless: ``sim_AI`` plays the whole
+    game in a plain loop without touching Tk. ``paint_every`` repaints a
+    window only every N AI moves. A PhaseProfiler passed as ``profiler``
+    collects time spent in the AI, moving, spawning and painting.
+    '''
     AI_DELAY = 1
-    def __init__(self, grid, panel, verbose=True):
+    HISTORY_DEPTH = 16
+    def __init__(self, grid, panel=None, verbose=True, paint_every=1, history_depth=HISTORY_DEPTH,
+                 profiler=None):
         self.grid = grid
         self.panel = panel
         self.start_cells_num = 2
@@ -283,7 +524,10 @@ class Game:
         self.won = False
         self.keep_playing = True
         self.verbose = verbose
-        self.history_ai = []
+        self.paint_every = paint_every
+        self.num_moves = 0
+        self.history_ai = GridHistory(grid.size, history_depth)
+        self.profiler = profiler
 
     def is_game_terminated(self):
         return self.over or (self.won and (not self.keep_playing))
@@ -297,60 +541,95 @@ class Game:
     
     def sim_AI(self, ai_func):
         self.add_start_cells()
+        self.history_ai.append(self.grid)
+
+        if self.panel is None:
+            while self.ai_step(ai_func):
+                pass
+            return self.grid.current_score
+
         self.panel.paint()
-        
-        self.history_ai.append(self.grid.copy())
         self.panel.root.after(Game.AI_DELAY, lambda: self.simulate_step(ai_func))
         self.panel.root.mainloop()
         return self.grid.current_score
     
     def simulate_step(self, ai_func):
-            if self.over:
-                print('Game over!')
-                return self.grid.current_score
+        try:
+            running = self.ai_step(ai_func)
+        except InvalidMoveError:
+            self.panel.root.destroy()
+            raise
 
-            # Strategy here
-            direction = ai_func(self.history_ai)
-            
-            if direction == 'w':
-                self.up()
-            elif direction == 'd':
-                self.right()
-            elif direction == 's':
-                self.down()
-            else:
-                self.left()
+        if running:
+            self.panel.root.after(Game.AI_DELAY, lambda: self.simulate_step(ai_func))
+        elif self.over and not self.verbose:
+            self.panel.root.destroy()
+        return self.grid.current_score
 
-            #assert ((self.grid.cells == self.history_ai[-1].cells) != self.grid.moved)
-            if self.grid.cells != self.history_ai[-1].cells:
-                self.history_ai.append(self.grid.copy())
-            else:
-                self.panel.root.destroy()
-                raise RuntimeError("Invalid Move! Move did not change board state")
+    def ai_step(self, ai_func):
+        '''Plays one AI move. Returns False once the game has ended.'''
+        if self.over:
+            print('Game over!')
+            return False
 
-            self.panel.paint()
-            if self.verbose:
-                print('Score: {}'.format(self.grid.current_score))
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
 
-            if self.grid.found_2048():
-                self.you_win()
-                if not self.keep_playing:
-                    print('Game over!')
-                    return self.grid.current_score
+        # Strategy here
+        direction = ai_func(self.history_ai)
+        if profiler is not None:
+            profiler.lap('ai')
 
-            if self.grid.moved:
-                self.grid.random_cell()
+        if direction == 'w':
+            self.up()
+        elif direction == 'd':
+            self.right()
+        elif direction == 's':
+            self.down()
+        else:
+            self.left()
 
-            self.panel.paint()
+        if not self.grid.moved:
+            raise InvalidMoveError("Invalid Move! Move did not change board state")
 
-            if not self.can_move():
-                self.over = True
-                self.game_over()
-                if not self.verbose:
-                    self.panel.root.destroy() 
-                return self.grid.current_score
+        self.num_moves += 1
+        if profiler is not None:
+            profiler.lap('move')
+        if self.paint_every == 1:
+            self.paint()
+            if profiler is not None:
+                profiler.lap('paint')
+        if self.verbose:
+            print('Score: {}'.format(self.grid.current_score))
 
-            self.panel.root.after(Game.AI_DELAY, lambda: self.simulate_step(ai_func))
+        if self.grid.found_2048():
+            self.you_win()
+            if not self.keep_playing:
+                self.paint(force=True)
+                print('Game over!')
+                return False
+
+        if self.grid.moved:
+            self.grid.random_cell()
+        self.history_ai.append(self.grid)
+
+        if not self.can_move():
+            self.paint(force=True)
+            self.over = True
+            self.game_over()
+            return False
+        if profiler is not None:
+            profiler.lap('spawn')
+
+        self.paint()
+        if profiler is not None:
+            profiler.lap('paint')
+        return True
+
+    def paint(self, force=False):
+        if self.panel is not None and (force or self.num_moves % self.paint_every == 0):
+            self.panel.paint()
 
     def add_start_cells(self):
         for i in range(self.start_cells_num):
@@ -405,8 +684,10 @@ class Game:
     
 
     def game_over(self):
+        if self.panel is None and not self.verbose:
+            return
         print('Game over!')
-        if self.verbose:
+        if self.verbose and self.panel is not None:
             messagebox.showinfo('2048', 'Oops!\n'
                                     'Game over!')
 
@@ -427,6 +708,55 @@ class Game:
    
 
 
+def bitset_ai(ai, moves=None, bits_per_tile=BITSET_TILE_BITS):
+    '''Wraps a packed-bitset ``ai(bs, action_space)`` policy as a ``sim_AI`` ai_func.
+
+    ``action_space`` holds (move, successor bitset) pairs, as in solvers/jw.
+
+    ``moves`` maps 'w'/'a'/'s'/'d' to the bitset engine's move functions
+    (see solvers/jw/gui.py). Without it, moves on bitsets are applied
+    through Grid.move_result, which is slow but needs no table build.
+    '''
+    def grid_move(direction, size):
+        def move(bitset):
+            grid = Grid.from_bitset(bitset, size, bits_per_tile)
+            return grid.move_result(direction).to_bitset(bits_per_tile)
+        move.__name__ = direction
+        return move
+
+    def ai_func(history):
+        grid = history[-1]
+        bitset = grid.to_bitset(bits_per_tile)
+
+        # Same action order as the bitset engine: left, up, right, down
+        action_space = []
+        successors = {}
+        for direction in ('a', 'w', 'd', 's'):
+            move = moves[direction] if moves is not None else grid_move(direction, grid.size)
+            new_bitset = move(bitset)
+            if new_bitset != bitset:
+                action_space.append((move, new_bitset))
+                successors[new_bitset] = direction
+
+        new_bitset = ai(bitset, action_space)
+        if new_bitset not in successors:
+            raise InvalidMoveError("Bitset AI returned a board that no legal move produces")
+        return successors[new_bitset]
+
+    ai_func.__name__ = getattr(ai, '__name__', type(ai).__name__)
+    return ai_func
+
+
+def run_headless(ai_func, num_games=1, size=4, keep_playing=True):
+    '''Plays ``num_games`` AI games without a window, returning the scores.'''
+    scores = []
+    for _ in range(num_games):
+        game = Game(Grid(size), verbose=False)
+        game.keep_playing = keep_playing
+        scores.append(game.sim_AI(ai_func))
+    return scores
+
+
 if __name__ == '__main__':
     size = 4
     grid = Grid(size)
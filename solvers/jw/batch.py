@@ -0,0 +1,154 @@
+import numpy as np
+
+import game
+
+# A batch of N boards is an (N, NROWS) uint32 array of packed rows, the same
+# rows that index the row tables in game.py. 80-bit boards do not fit a
+# single machine word, so this is the "uint128" layout. Only shapes with
+# dense row tables (ROW_BITS <= MAX_TABLE_BITS) are supported.
+ROW_DTYPE = np.uint32
+
+_LAYOUT = None
+
+
+def _layout():
+    # Tables and shifts for the engine's current shape, see game.configure
+    global _LAYOUT
+    game._build_row_tables()
+    if _LAYOUT is None or _LAYOUT[0] is not game._ROW_LEFT_TABLE:
+        if isinstance(game._ROW_LEFT_TABLE, dict):
+            raise ValueError(
+                f'batch engine needs dense row tables, but rows are {game.ROW_BITS} bits '
+                f'(MAX_TABLE_BITS = {game.MAX_TABLE_BITS})')
+        _LAYOUT = (
+            game._ROW_LEFT_TABLE,
+            # Zero-copy views over the (memory-mapped) tables
+            np.frombuffer(game._ROW_LEFT_TABLE, dtype=ROW_DTYPE),
+            np.frombuffer(game._ROW_RIGHT_TABLE, dtype=ROW_DTYPE),
+            np.arange(game.NCOLS, dtype=ROW_DTYPE) * game.BITS_PER_TILE,
+            ROW_DTYPE((1 << game.BITS_PER_TILE) - 1),
+        )
+    return _LAYOUT
+
+
+def to_rows(bitsets) -> np.ndarray:
+    bitsets = list(bitsets)
+    rows = np.empty((len(bitsets), game.NROWS), dtype=ROW_DTYPE)
+    for r in range(game.NROWS):
+        shift = r * game.ROW_BITS
+        rows[:, r] = [(bs >> shift) & game.ROW_MASK for bs in bitsets]
+    return rows
+
+
+def to_bitsets(rows: np.ndarray) -> list[int]:
+    row_bits = game.ROW_BITS
+    out = []
+    for board in rows.tolist():
+        bs = 0
+        for r, row in enumerate(board):
+            bs |= row << (r * row_bits)
+        out.append(bs)
+    return out
+
+
+def to_cells(rows: np.ndarray) -> np.ndarray:
+    _, _, _, shifts, tile_mask = _layout()
+    return ((rows[..., None] >> shifts) & tile_mask).astype(np.uint8)
+
+
+def from_cells(cells: np.ndarray) -> np.ndarray:
+    shifts = _layout()[3]
+    return np.bitwise_or.reduce(cells.astype(ROW_DTYPE) << shifts, axis=-1)
+
+
+def _transpose(rows: np.ndarray) -> np.ndarray:
+    return from_cells(to_cells(rows).swapaxes(-1, -2))
+
+
+def left(rows: np.ndarray) -> np.ndarray:
+    return _layout()[1][rows]
+
+
+def right(rows: np.ndarray) -> np.ndarray:
+    return _layout()[2][rows]
+
+
+def up(rows: np.ndarray) -> np.ndarray:
+    return _transpose( left(_transpose(rows)) )
+
+
+def down(rows: np.ndarray) -> np.ndarray:
+    return _transpose( right(_transpose(rows)) )
+
+
+# Same order as game.MOVES
+MOVES = (left, up, right, down)
+
+
+def successors(rows: np.ndarray) -> np.ndarray:
+    '''All four moves at once: an (N, 4, NROWS) array in MOVES order.'''
+    return np.stack([move(rows) for move in MOVES], axis=1)
+
+
+def legal_mask(rows: np.ndarray, succ: np.ndarray | None = None) -> np.ndarray:
+    if succ is None:
+        succ = successors(rows)
+    return (succ != rows[:, None, :]).any(axis=-1)
+
+
+def get_empty_tiles(rows: np.ndarray) -> np.ndarray:
+    '''Number of empty cells per board.'''
+    return (to_cells(rows) == 0).sum(axis=(-1, -2))
+
+
+def get_max_tile(rows: np.ndarray) -> np.ndarray:
+    return np.int64(1) << to_cells(rows).max(axis=(-1, -2)).astype(np.int64)
+
+
+def generate_tile(rows: np.ndarray, rng: np.random.Generator | None = None) -> np.ndarray:
+    # Deterministic tests with injected RNG
+    if rng is None:
+        rng = np.random.default_rng()
+
+    n     = len(rows)
+    empty = (to_cells(rows) == 0).reshape(n, -1)
+    count = empty.sum(axis=1)
+
+    # k-th empty cell per board, picked through the running count of empties
+    k   = (rng.random(n) * count).astype(np.int64)
+    pos = (np.cumsum(empty, axis=1) > k[:, None]).argmax(axis=1)
+    val = np.where(rng.random(n) < 0.9, 1, 2).astype(ROW_DTYPE)
+
+    # Full boards are returned unchanged, as in game.generate_tile
+    val[count == 0] = 0
+
+    out = rows.copy()
+    r, c = np.divmod(pos, game.NCOLS)
+    out[np.arange(n), r] |= val << (c * game.BITS_PER_TILE).astype(ROW_DTYPE)
+    return out
+
+
+def uniform_policy(boards: np.ndarray, legal: np.ndarray) -> np.ndarray:
+    '''Batched counterpart of picking a random action from the action space.'''
+    n = len(boards)
+    k = (np.random.random(n) * legal.sum(axis=1)).astype(np.int64)
+    return (np.cumsum(legal, axis=1) > k[:, None]).argmax(axis=1)
+
+
+def greedy_policy(heuristic):
+    '''Batched one-ply policy: the legal move whose successor scores best.
+
+    ``heuristic`` is a ``heuristic.Heuristic``; its row table is scored
+    over the rows and columns of every successor at once.
+    '''
+    table = np.asarray(heuristic.table)
+
+    def policy(boards: np.ndarray, legal: np.ndarray | None = None) -> np.ndarray:
+        succ = successors(boards)
+        if legal is None:
+            legal = legal_mask(boards, succ)
+        scores = table[succ].sum(axis=-1) + table[_transpose(succ)].sum(axis=-1)
+        return np.where(legal, scores, -np.inf).argmax(axis=1)
+
+    policy.__name__ = 'greedy_policy'
+    return policy
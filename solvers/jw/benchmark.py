@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+
+import game
+
+# Reference policies, same as the ones in test.ipynb
+
+def noskill(bs, action_space):
+    return random.choice(action_space)[1]
+
+def naive_minimize_empty_tiles(bs, action_space):
+    return max((new_bs for _, new_bs in action_space), key=game.count_empty_tiles)
+
+POLICIES = (noskill, naive_minimize_empty_tiles)
+
+
+def _best_rate(fn, count, repeat):
+    # Calls per second of the fastest of `repeat` timed runs, after a warmup
+    fn()
+    best = min(_timed(fn) for _ in range(repeat))
+    return count / best if best else float('inf')
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def _random_boards(rng, count):
+    # Mid-game boards: about half the cells filled with small tiles
+    boards = []
+    for _ in range(count):
+        board = [[rng.choice((0, 0, 1, 1, 2, 3, 4, 5, 6, 7)) for _ in range(game.NCOLS)]
+                 for _ in range(game.NROWS)]
+        boards.append(game.to_bitset(board))
+    return boards
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_tables(cold=True):
+    results = {}
+    if cold:
+        # Build into an empty cache dir so nothing is reused
+        cache_dir = game.TABLE_CACHE_DIR
+        with tempfile.TemporaryDirectory() as tmp:
+            game.TABLE_CACHE_DIR = tmp
+            results['build_seconds'] = _timed(lambda: game._build_row_tables(rebuild=True))
+            game.TABLE_CACHE_DIR = cache_dir
+            game._ROW_LEFT_TABLE = game._ROW_RIGHT_TABLE = None
+
+    game._build_row_tables()
+    game._ROW_LEFT_TABLE = game._ROW_RIGHT_TABLE = None
+    results['load_seconds'] = _timed(game._build_row_tables)
+    # Lazy tables for large rows have nothing on disk to report
+    if not isinstance(game._ROW_LEFT_TABLE, dict):
+        results['table_bytes'] = sum(
+            table.nbytes for table in (game._ROW_LEFT_TABLE, game._ROW_RIGHT_TABLE)
+            if isinstance(table, memoryview))
+    return results
+
+def bench_moves(boards, repeat):
+    results = {}
+    for move in game.MOVES:
+        results[f'{move.__name__}_per_sec'] = _best_rate(
+            lambda: [move(bs) for bs in boards], len(boards), repeat)
+    return results
+
+def bench_generate_tile(boards, seed, repeat):
+    rng = random.Random(seed)
+    return {
+        'generate_tile_per_sec': _best_rate(
+            lambda: [game.generate_tile(bs, rng) for bs in boards], len(boards), repeat),
+        'count_empty_tiles_per_sec': _best_rate(
+            lambda: [game.count_empty_tiles(bs) for bs in boards], len(boards), repeat),
+    }
+
+def bench_games(num_games, seed):
+    results = {}
+    g = game.Game()
+    for policy in POLICIES:
+        # Warm up, then replay the same seeded games
+        g.run_game(policy, num_games=1, seed=seed)
+        start = time.perf_counter()
+        game_results, name = g.run_game(policy, num_games=num_games, seed=seed)
+        elapsed = time.perf_counter() - start
+
+        turns = sum(result['num_turns_taken'] for result in game_results)
+        results[name] = {
+            'games': num_games,
+            'turns': turns,
+            'games_per_sec': num_games / elapsed,
+            'turns_per_sec': turns / elapsed,
+            'avg_max_tile': sum(r['max_tile_reached'] for r in game_results) / num_games,
+        }
+    return results
+
+def bench_batch(boards, repeat):
+    try:
+        import batch
+    except ImportError:
+        return None
+    if isinstance(game._ROW_LEFT_TABLE, dict):
+        # The batch engine needs dense row tables
+        return None
+
+    rows = batch.to_rows(boards)
+    return {
+        'successors_boards_per_sec': _best_rate(lambda: batch.successors(rows), len(rows), repeat),
+        'generate_tile_boards_per_sec': _best_rate(
+            lambda: batch.generate_tile(rows, batch.np.random.default_rng(0)), len(rows), repeat),
+    }
+
+def bench_memory(num_games, seed):
+    tracemalloc.start()
+    game.Game().run_game(noskill, num_games=num_games, seed=seed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        maxrss *= 1024
+    return {'game_loop_peak_bytes': peak, 'max_rss_bytes': maxrss}
+
+
+def run(num_boards=20000, num_games=200, seed=0, repeat=5, cold=True, size=None,
+        bits_per_tile=None):
+    # Benchmarks the configured shape, or switches to size/bits_per_tile first
+    if size is not None or bits_per_tile is not None:
+        game.configure(size or game.NCOLS, bits_per_tile or game.BITS_PER_TILE)
+    rng    = random.Random(seed)
+    tables = bench_tables(cold)
+    boards = _random_boards(rng, num_boards)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'num_boards': num_boards,
+            'num_games': num_games,
+            'repeat': repeat,
+            'bits_per_tile': game.BITS_PER_TILE,
+            'ncols': game.NCOLS,
+            'nrows': game.NROWS,
+        },
+        'tables': tables,
+        'moves': bench_moves(boards, repeat),
+        'tiles': bench_generate_tile(boards, seed, repeat),
+        'games': bench_games(num_games, seed),
+        'batch': bench_batch(boards, repeat),
+        'memory': bench_memory(min(num_games, 50), seed),
+    }
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+def compare(old, new):
+    old_values = dict(_flatten({k: v for k, v in old.items() if k != 'meta'}))
+    for key, value in _flatten({k: v for k, v in new.items() if k != 'meta'}):
+        if old_values.get(key):
+            print(f'{key:55} {old_values[key]:>14.6g} -> {value:>14.6g}  ({value / old_values[key]:.2f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput baselines for the bitset engine')
+    parser.add_argument('--out', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--boards', type=int, default=20000)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--size', type=int, default=None, help='board size, 4 by default')
+    parser.add_argument('--bits-per-tile', type=int, default=None, help='5 by default')
+    parser.add_argument('--no-cold-build', action='store_true',
+                        help='skip timing a table build from scratch')
+    args = parser.parse_args()
+
+    results = run(args.boards, args.games, args.seed, args.repeat, not args.no_cold_build,
+                  args.size, args.bits_per_tile)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,167 @@
+import time
+from collections import OrderedDict
+
+import game
+from heuristic import Heuristic
+
+# Spawn values are log2 exponents: a 2 with p=0.9, a 4 with p=0.1
+SPAWNS = ((1, 0.9), (2, 0.1))
+
+# Nodes searched between deadline checks
+DEADLINE_CHECK_NODES = 32
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class Expectimax:
+    '''Depth-limited expectimax over the packed bitset moves.
+
+    Usable directly as a ``Game.run_game`` AI. ``depth`` counts player
+    moves; chance nodes average over every empty cell and both spawn values.
+    Chance node values are cached in a transposition table capped at
+    ``table_size`` entries (least recently used entries are evicted first).
+    By default the table is keyed by the board integer. With ``symmetry``
+    it is keyed by ``game.canonical`` so the 8 rotations and reflections of
+    a board share one entry, which is only sound if ``heuristic`` scores
+    all 8 the same, as ``heuristic.Heuristic`` does and a non-symmetric
+    ``NTupleNetwork`` does not.
+
+    With a ``time_budget`` in seconds the search deepens iteratively, one
+    player move at a time up to ``depth``, until the budget runs out and
+    returns the best move of the deepest completed iteration. Depth 1 is
+    always completed. Later iterations reuse the table entries of earlier
+    ones. ``last_depth`` is the depth the last decision was made at. Leaves
+    are scored with ``heuristic``, by default the table-driven
+    ``heuristic.Heuristic``.
+    '''
+    def __init__(self, depth=2, table_size=1 << 20, heuristic=None, loss_score=0.0,
+                 symmetry=False, time_budget=None):
+        self.depth      = depth
+        self.table_size = table_size
+        self.heuristic  = heuristic or Heuristic()
+        self.loss_score = loss_score
+        self.symmetry    = symmetry
+        self.time_budget = time_budget
+        self.table       = OrderedDict()
+        self.last_depth  = None
+        self._deadline   = None
+        self.__name__    = f'expectimax_d{depth}'
+        if time_budget is not None:
+            self.__name__ += f'_{time_budget * 1000:g}ms'
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes       = 0
+        self.lookups     = 0
+        self.hits        = 0
+        self.search_time = 0.0
+
+    def clear_table(self):
+        self.table.clear()
+
+    def stats(self):
+        return {
+            'nodes': self.nodes,
+            'search_time': self.search_time,
+            'nodes_per_sec': self.nodes / self.search_time if self.search_time else 0.0,
+            'table_lookups': self.lookups,
+            'table_hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'table_entries': len(self.table),
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f'Test: {self.__name__}')
+        print(f'Nodes searched: {stats["nodes"]}')
+        print(f'Nodes per second: {stats["nodes_per_sec"]}')
+        print(f'Table hit rate: {stats["table_hit_rate"]}')
+        print(f'Table entries: {stats["table_entries"]} / {self.table_size}')
+
+    def __call__(self, bs, action_space):
+        start = time.time()
+
+        if self.time_budget is None:
+            best_bs = self._search(action_space, self.depth)
+            self.last_depth = self.depth
+        else:
+            best_bs = self._deepen(action_space, start + self.time_budget)
+
+        self.search_time += time.time() - start
+        return best_bs
+
+    def _search(self, action_space, depth):
+        best_bs, best_value = None, float('-inf')
+        for _, new_bs in action_space:
+            value = self._chance(new_bs, depth - 1)
+            if value > best_value:
+                best_bs, best_value = new_bs, value
+        return best_bs
+
+    def _deepen(self, action_space, deadline):
+        best_bs = self._search(action_space, 1)
+        self.last_depth = 1
+
+        # A timed-out iteration is discarded whole
+        self._deadline = deadline
+        try:
+            for depth in range(2, self.depth + 1):
+                if time.time() >= deadline:
+                    break
+                best_bs = self._search(action_space, depth)
+                self.last_depth = depth
+        except _SearchTimeout:
+            pass
+        finally:
+            self._deadline = None
+        return best_bs
+
+    def _max(self, bs, depth):
+        self.nodes += 1
+
+        best = None
+        for new_bs in game.get_successors(bs):
+            if new_bs != bs:
+                value = self._chance(new_bs, depth - 1)
+                if best is None or value > best:
+                    best = value
+
+        return self.loss_score if best is None else best
+
+    def _chance(self, bs, depth):
+        self.nodes += 1
+        if (self._deadline is not None and not self.nodes % DEADLINE_CHECK_NODES
+                and time.time() >= self._deadline):
+            raise _SearchTimeout
+        if depth <= 0:
+            return self.heuristic(bs)
+
+        # An entry searched at least as deep is as good as a fresh search
+        self.lookups += 1
+        key   = game.canonical(bs) if self.symmetry else bs
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            self.hits += 1
+            self.table.move_to_end(key)
+            return entry[1]
+
+        empty = game.get_empty_mask(bs)
+        if not empty:
+            value = self._max(bs, depth)
+        else:
+            count = empty.bit_count()
+            value = 0.0
+            while empty:
+                # Lowest bit of the cell's field, so tile * low places the tile
+                low = empty & -empty
+                empty ^= low
+                for tile, prob in SPAWNS:
+                    value += prob * self._max(bs | tile * low, depth)
+            value /= count
+
+        self.table[key] = (depth, value)
+        self.table.move_to_end(key)
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+        return value
@@ -1,12 +1,31 @@
+import os
+import math
+import hashlib
+import inspect
+import mmap
 import time
 import random
+from array import array
 
 BITS_PER_TILE = 5
 NCOLS = NROWS = 4
-ROW_MASK      = (1 << BITS_PER_TILE * NCOLS) - 1
+ROW_BITS      = BITS_PER_TILE * NCOLS
+ROW_MASK      = (1 << ROW_BITS) - 1
 _ROW_LEFT_TABLE  = None
 _ROW_RIGHT_TABLE = None
 
+# Rows wider than this are not tabulated densely (2^ROW_BITS entries);
+# their moves are computed on first sight and memoised instead.
+MAX_TABLE_BITS = 22
+
+# Row tables are built once per (BITS_PER_TILE, NCOLS) and definition of the
+# functions computing them, and memory-mapped from here on later imports, so
+# workers on one host share the same pages.
+TABLE_CACHE_DIR = os.environ.get(
+    'JW_TABLE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', '2048-solvers'),
+)
+
 def to_board(bitset):
     mask  = (1 << BITS_PER_TILE) - 1
     board = [[0] * NCOLS for _ in range(NROWS)]
@@ -40,67 +59,260 @@ def print_board(board, label = None):
         
 
 def _reverse_row_bits(row: int) -> int:
-    t0 = (row & 0x000001F) << 15
-    t1 = (row & 0x0003E0) << 5
-    t2 = (row & 0x007C00) >> 5
-    t3 = (row & 0x0F8000) >> 15
-    return t0 | t1 | t2 | t3
+    res  = 0
+    mask = (1 << BITS_PER_TILE) - 1
+    for c in range(NCOLS):
+        tile = (row >> (c * BITS_PER_TILE)) & mask
+        res |= tile << ((NCOLS - 1 - c) * BITS_PER_TILE)
+    return res
 
-def _build_row_tables():
-    global _ROW_LEFT_TABLE, _ROW_RIGHT_TABLE
-    _ROW_LEFT_TABLE = [0] * (1 << BITS_PER_TILE * NCOLS)
-    _ROW_RIGHT_TABLE = [0] * (1 << BITS_PER_TILE * NCOLS)
-    mask = 0x1F
-
-    for row in range(1 << 20):
-        tiles = [(row >> (i * BITS_PER_TILE)) & mask for i in range(4)]
-
-        # Slide left
-        compressed = [t for t in tiles if t]
-
-        merged = []
-        i = 0
-        while i < len(compressed):
-            if i + 1 < len(compressed) and compressed[i] == compressed[i + 1]:
-                merged.append(compressed[i] + 1)
-                i += 2
-            else:
-                merged.append(compressed[i])
-                i += 1
+def _source_tag(*fns) -> str:
+    # Short hash of the functions that compute a cached table, part of its
+    # file name so that changing their definition forces a rebuild
+    digest = hashlib.sha1()
+    for fn in fns:
+        try:
+            digest.update(inspect.getsource(fn).encode())
+        except (OSError, TypeError):
+            digest.update(fn.__code__.co_code)
+    return digest.hexdigest()[:8]
+
+def _table_path(name: str) -> str:
+    return os.path.join(
+        TABLE_CACHE_DIR, f'{name}_b{BITS_PER_TILE}_c{NCOLS}.bin')
+
+def _load_table(name: str, typecode: str, length: int):
+    try:
+        with open(_table_path(name), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mm) != length * array(typecode).itemsize:
+        mm.close()
+        return None
+    return memoryview(mm).cast(typecode)
+
+def _save_table(name: str, table: array) -> None:
+    path = _table_path(name)
+    tmp  = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(TABLE_CACHE_DIR, exist_ok=True)
+        with open(tmp, 'wb') as f:
+            table.tofile(f)
+        # Atomic so concurrent workers never map a half-written file
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+class _LazyRowTable(dict):
+    # Stand-in for a dense row table: rows are computed on first lookup.
+    # Cleared when full, which only costs recomputation.
+    MAX_ENTRIES = 1 << 20
+
+    def __init__(self, row_fn):
+        super().__init__()
+        self.row_fn = row_fn
+
+    def __missing__(self, row):
+        if len(self) >= self.MAX_ENTRIES:
+            self.clear()
+        value = self[row] = self.row_fn(row)
+        return value
+
+def _cached_table(name: str, typecode: str, build, rebuild: bool = False):
+    length = 1 << ROW_BITS
+    if not rebuild:
+        table = _load_table(name, typecode, length)
+        if table is not None:
+            return table
+
+    table = build()
+    _save_table(name, table)
+    # Prefer the mapped copy so this process shares pages with later ones
+    return _load_table(name, typecode, length) or table
+
+def _row_table(name: str, typecode: str, row_fn, rebuild: bool = False):
+    if ROW_BITS > MAX_TABLE_BITS:
+        return _LazyRowTable(row_fn)
+
+    def build():
+        return array(typecode, map(row_fn, range(1 << ROW_BITS)))
+
+    return _cached_table(name, typecode, build, rebuild)
+
+def _row_tiles(row: int) -> list[int]:
+    mask = (1 << BITS_PER_TILE) - 1
+    return [(row >> (i * BITS_PER_TILE)) & mask for i in range(NCOLS)]
 
-        merged.extend([0] * (4 - len(merged)))
+def _slide_row_left(row: int) -> int:
+    tiles = _row_tiles(row)
 
-        # Pack back to bits
-        left_bits = 0
-        for idx, val in enumerate(merged):
-            left_bits |= val << (idx * BITS_PER_TILE)
-        _ROW_LEFT_TABLE[row] = left_bits
+    # Slide left
+    compressed = [t for t in tiles if t]
 
-    for row in range(1 << 20):
-        _ROW_RIGHT_TABLE[row] = _reverse_row_bits(
-            _ROW_LEFT_TABLE[_reverse_row_bits(row)]
-        )
-        
-    print(f'sum of left table: {sum(_ROW_LEFT_TABLE)}')
-    print(f'sum of right table: {sum(_ROW_RIGHT_TABLE)}')
+    merged = []
+    i = 0
+    while i < len(compressed):
+        if i + 1 < len(compressed) and compressed[i] == compressed[i + 1]:
+            merged.append(compressed[i] + 1)
+            i += 2
+        else:
+            merged.append(compressed[i])
+            i += 1
+
+    # Pack back to bits
+    left_bits = 0
+    for idx, val in enumerate(merged):
+        left_bits |= val << (idx * BITS_PER_TILE)
+    return left_bits
+
+def _slide_row_right(row: int) -> int:
+    return _reverse_row_bits(_ROW_LEFT_TABLE[_reverse_row_bits(row)])
+
+def _build_row_tables(rebuild: bool = False):
+    global _ROW_LEFT_TABLE, _ROW_RIGHT_TABLE
+    if _ROW_LEFT_TABLE is not None and not rebuild:
+        return
+
+    tag = _source_tag(_row_tiles, _slide_row_left, _reverse_row_bits)
+    _ROW_LEFT_TABLE  = _row_table(f'row_left_{tag}', 'I', _slide_row_left, rebuild)
+    _ROW_RIGHT_TABLE = _row_table(f'row_right_{tag}', 'I', _slide_row_right, rebuild)
+
+def _cell_mask(cells) -> int:
+    mask = 0
+    for i in cells:
+        mask |= ((1 << BITS_PER_TILE) - 1) << (i * BITS_PER_TILE)
+    return mask
+
+def _transpose_blocks():
+    # Power-of-two boards transpose in log2(n) rounds of masked swaps:
+    # off-diagonal cells inside each 2x2 block, then off-diagonal 2x2
+    # blocks inside each 4x4 block, and so on.
+    n = NCOLS
+    if n & (n - 1):
+        return []
+
+    steps = []
+    b = 1
+    while b < n:
+        cells = range(n * n)
+        keep  = _cell_mask(i for i in cells if (i // n) // b % 2 == (i % n) // b % 2)
+        up    = _cell_mask(i for i in cells if (i // n) // b % 2 == 0 and (i % n) // b % 2 == 1)
+        down  = _cell_mask(i for i in cells if (i // n) // b % 2 == 1 and (i % n) // b % 2 == 0)
+        steps.append((keep, up, down, b * (n - 1) * BITS_PER_TILE))
+        b *= 2
+    return steps
+
+def _transpose_diagonals():
+    # Any other size moves each diagonal c - r = d by d * (n - 1) cells
+    n = NCOLS
+    steps = []
+    for d in range(1, n):
+        up   = _cell_mask(r * n + r + d for r in range(n - d))
+        down = _cell_mask((r + d) * n + r for r in range(n - d))
+        steps.append((up, down, d * (n - 1) * BITS_PER_TILE))
+    return steps
+
+def _reflection(n, cell, distance):
+    # Masked swaps for a reflection that moves line i to line n - 1 - i,
+    # where cell(line, k) is the k-th cell of a line and distance(line) is
+    # the shift that takes line i onto its mirror image
+    keep  = _cell_mask(cell(n // 2, k) for k in range(n)) if n % 2 else 0
+    pairs = []
+    for i in range(n // 2):
+        pairs.append((_cell_mask(cell(i, k) for k in range(n)),
+                      _cell_mask(cell(n - 1 - i, k) for k in range(n)),
+                      (n - 1 - 2 * i) * distance))
+    return keep, pairs
+
+def configure(size: int = 4, bits_per_tile: int = 5) -> None:
+    '''Switches the engine to size x size boards with bits_per_tile-bit tiles.
+
+    Row tables for the new shape are loaded or built on the next
+    _build_row_tables(); bits_per_tile=6 allows tiles up to 2^63.
+    '''
+    global BITS_PER_TILE, NCOLS, NROWS, ROW_BITS, ROW_MASK
+    global _ROW_LEFT_TABLE, _ROW_RIGHT_TABLE, _ROW_SHIFTS
+    global _DIAGONAL, _TRANSPOSE_BLOCKS, _TRANSPOSE_DIAGONALS, _LOW_BITS
+    global _MIRROR_KEEP, _MIRROR_PAIRS, _FLIP_KEEP, _FLIP_PAIRS
+
+    BITS_PER_TILE = bits_per_tile
+    NCOLS = NROWS = size
+    ROW_BITS      = BITS_PER_TILE * NCOLS
+    ROW_MASK      = (1 << ROW_BITS) - 1
+    _ROW_SHIFTS   = tuple(r * ROW_BITS for r in range(NROWS))
+    _DIAGONAL     = _cell_mask(r * size + r for r in range(size))
+    _LOW_BITS     = sum(1 << (i * BITS_PER_TILE) for i in range(NROWS * NCOLS))
+    _TRANSPOSE_BLOCKS    = _transpose_blocks()
+    _TRANSPOSE_DIAGONALS = [] if _TRANSPOSE_BLOCKS else _transpose_diagonals()
+    _MIRROR_KEEP, _MIRROR_PAIRS = _reflection(size, lambda c, r: r * size + c, BITS_PER_TILE)
+    _FLIP_KEEP, _FLIP_PAIRS     = _reflection(size, lambda r, c: r * size + c, ROW_BITS)
+    _ROW_LEFT_TABLE  = None
+    _ROW_RIGHT_TABLE = None
+
+configure(NCOLS, BITS_PER_TILE)
 
 def _transpose(bitset: int) -> int:
-    res = 0
-    mask = 0x1F
-    for r in range(4):
-        for c in range(4):
-            tile = (bitset >> ((r * 4 + c) * BITS_PER_TILE)) & mask
-            res  |= tile << ((c * 4 + r) * BITS_PER_TILE)
+    if NCOLS == 4:
+        (k1, u1, d1, s1), (k2, u2, d2, s2) = _TRANSPOSE_BLOCKS
+        bitset = (bitset & k1) | (bitset & u1) << s1 | (bitset & d1) >> s1
+        return (bitset & k2) | (bitset & u2) << s2 | (bitset & d2) >> s2
+
+    for keep, up_mask, down_mask, shift in _TRANSPOSE_BLOCKS:
+        bitset = ((bitset & keep)
+                  | (bitset & up_mask) << shift
+                  | (bitset & down_mask) >> shift)
+    if not _TRANSPOSE_DIAGONALS:
+        return bitset
+
+    res = bitset & _DIAGONAL
+    for up_mask, down_mask, shift in _TRANSPOSE_DIAGONALS:
+        res |= (bitset & up_mask) << shift | (bitset & down_mask) >> shift
     return res
 
-import random
+def _mirror(bitset: int) -> int:
+    # Reverses the cells of every row
+    if NCOLS == 4:
+        (l1, h1, s1), (l2, h2, s2) = _MIRROR_PAIRS
+        return ((bitset & l1) << s1 | (bitset & h1) >> s1
+                | (bitset & l2) << s2 | (bitset & h2) >> s2)
+
+    res = bitset & _MIRROR_KEEP
+    for low, high, shift in _MIRROR_PAIRS:
+        res |= (bitset & low) << shift | (bitset & high) >> shift
+    return res
+
+def _flip(bitset: int) -> int:
+    # Reverses the order of the rows
+    if NROWS == 4:
+        (l1, h1, s1), (l2, h2, s2) = _FLIP_PAIRS
+        return ((bitset & l1) << s1 | (bitset & h1) >> s1
+                | (bitset & l2) << s2 | (bitset & h2) >> s2)
+
+    res = bitset & _FLIP_KEEP
+    for low, high, shift in _FLIP_PAIRS:
+        res |= (bitset & low) << shift | (bitset & high) >> shift
+    return res
+
+def get_empty_mask(bitset: int) -> int:
+    # Lowest bit of every empty cell's field, found without unpacking cells:
+    # OR each field's bits down onto its lowest bit, then invert
+    occupied = bitset
+    for shift in range(1, BITS_PER_TILE):
+        occupied |= bitset >> shift
+    return ~occupied & _LOW_BITS
+
+def count_empty_tiles(bitset: int) -> int:
+    return get_empty_mask(bitset).bit_count()
 
 def get_empty_tiles(bitset: int) -> list[int]:
-    mask = (1 << BITS_PER_TILE) - 1
-    empty_indices = [
-        i for i in range(NROWS * NCOLS)
-        if ((bitset >> (i * BITS_PER_TILE)) & mask) == 0
-    ]
+    empty = get_empty_mask(bitset)
+    empty_indices = []
+    while empty:
+        low = empty & -empty
+        empty_indices.append((low.bit_length() - 1) // BITS_PER_TILE)
+        empty ^= low
     return empty_indices
 
 
@@ -109,27 +321,39 @@ def generate_tile(bitset: int, rng: random.Random | None = None) -> int:
     if rng is None:
         rng = random
 
-    empty_indices = get_empty_tiles(bitset)
-    if not empty_indices:
+    empty = get_empty_mask(bitset)
+    if not empty:
         # assert False, "No space to generate tile"
         return bitset
 
-    pos   = rng.choice(empty_indices)
-    val   = 1 if rng.random() < 0.9 else 2
-    shift = pos * BITS_PER_TILE
+    # Drop the k lowest empty cells and take the next one; randrange draws
+    # exactly what choice() over the index list used to
+    for _ in range(rng.randrange(empty.bit_count())):
+        empty &= empty - 1
+    val = 1 if rng.random() < 0.9 else 2
+
+    return bitset | (val * (empty & -empty))
 
-    return bitset | (val << shift)
+def get_successors(bitset: int) -> tuple[int, int, int, int]:
+    # Fixed 4 slots in MOVES order; an illegal move leaves the board as is
+    return left(bitset), up(bitset), right(bitset), down(bitset)
 
-def get_action_space(bitset: int) -> list[int]:
+def get_action_space(bitset: int) -> list[tuple]:
+    # (action, successor board) for every legal move, so AIs don't have to
+    # redo the moves that were needed to test legality
     out = []
-    if left(bitset) != bitset:
-        out.append(left)
-    if up(bitset) != bitset:
-        out.append(up)
-    if right(bitset) != bitset:
-        out.append(right)
-    if down(bitset) != bitset:
-        out.append(down)
+    new_bs = left(bitset)
+    if new_bs != bitset:
+        out.append((left, new_bs))
+    new_bs = up(bitset)
+    if new_bs != bitset:
+        out.append((up, new_bs))
+    new_bs = right(bitset)
+    if new_bs != bitset:
+        out.append((right, new_bs))
+    new_bs = down(bitset)
+    if new_bs != bitset:
+        out.append((down, new_bs))
     return out
 
 def get_max_tile(bitset: int) -> int:
@@ -141,18 +365,32 @@ def get_max_tile(bitset: int) -> int:
 
 
 def left(bitset: int) -> int:
+    table = _ROW_LEFT_TABLE
+    if NROWS == 4:
+        _, s1, s2, s3 = _ROW_SHIFTS
+        return (table[bitset & ROW_MASK]
+                | table[(bitset >> s1) & ROW_MASK] << s1
+                | table[(bitset >> s2) & ROW_MASK] << s2
+                | table[(bitset >> s3) & ROW_MASK] << s3)
+
     res = 0
-    for r in range(4):
-        row_bits = (bitset >> (r * 20)) & ROW_MASK
-        res     |= _ROW_LEFT_TABLE[row_bits] << (r * 20)
+    for shift in _ROW_SHIFTS:
+        res |= table[(bitset >> shift) & ROW_MASK] << shift
     return res
 
 
 def right(bitset: int) -> int:
+    table = _ROW_RIGHT_TABLE
+    if NROWS == 4:
+        _, s1, s2, s3 = _ROW_SHIFTS
+        return (table[bitset & ROW_MASK]
+                | table[(bitset >> s1) & ROW_MASK] << s1
+                | table[(bitset >> s2) & ROW_MASK] << s2
+                | table[(bitset >> s3) & ROW_MASK] << s3)
+
     res = 0
-    for r in range(4):
-        row_bits = (bitset >> (r * 20)) & ROW_MASK
-        res     |= _ROW_RIGHT_TABLE[row_bits] << (r * 20)
+    for shift in _ROW_SHIFTS:
+        res |= table[(bitset >> shift) & ROW_MASK] << shift
     return res
 
 
@@ -164,18 +402,257 @@ def down(bitset: int) -> int:
     return _transpose( right(_transpose(bitset)) )
 
 
-
+MOVES = (left, up, right, down)
+
+# How each reflection permutes MOVES: g(MOVES[a](bs)) == MOVES[p[a]](g(bs))
+_MIRROR_MOVES    = (2, 1, 0, 3)
+_FLIP_MOVES      = (0, 3, 2, 1)
+_TRANSPOSE_MOVES = (1, 0, 3, 2)
+
+def _symmetry_remap(*perms):
+    # Composes reflections applied right to left, then inverts, giving the
+    # original action for each action on the transformed board
+    p = tuple(range(4))
+    for perm in reversed(perms):
+        p = tuple(perm[a] for a in p)
+    return tuple(p.index(a) for a in range(4))
+
+# In the order canonicalize generates the 8 symmetric boards
+_SYMMETRY_REMAPS = (
+    _symmetry_remap(),
+    _symmetry_remap(_MIRROR_MOVES),
+    _symmetry_remap(_FLIP_MOVES),
+    _symmetry_remap(_FLIP_MOVES, _MIRROR_MOVES),
+    _symmetry_remap(_TRANSPOSE_MOVES),
+    _symmetry_remap(_MIRROR_MOVES, _TRANSPOSE_MOVES),
+    _symmetry_remap(_FLIP_MOVES, _TRANSPOSE_MOVES),
+    _symmetry_remap(_FLIP_MOVES, _MIRROR_MOVES, _TRANSPOSE_MOVES),
+)
+
+
+def canonical(bitset: int) -> int:
+    '''The smallest of the board's 8 rotations and reflections.'''
+    if NCOLS == 4:
+        # Inlined reflections, this is on the transposition table hot path
+        (ml1, mh1, ms1), (ml2, mh2, ms2) = _MIRROR_PAIRS
+        (fl1, fh1, fs1), (fl2, fh2, fs2) = _FLIP_PAIRS
+        (k1, u1, d1, s1), (k2, u2, d2, s2) = _TRANSPOSE_BLOCKS
+        b  = bitset
+        t  = (b & k1) | (b & u1) << s1 | (b & d1) >> s1
+        t  = (t & k2) | (t & u2) << s2 | (t & d2) >> s2
+        m  = (b & ml1) << ms1 | (b & mh1) >> ms1 | (b & ml2) << ms2 | (b & mh2) >> ms2
+        tm = (t & ml1) << ms1 | (t & mh1) >> ms1 | (t & ml2) << ms2 | (t & mh2) >> ms2
+        return min(
+            b, m, t, tm,
+            (b & fl1) << fs1 | (b & fh1) >> fs1 | (b & fl2) << fs2 | (b & fh2) >> fs2,
+            (m & fl1) << fs1 | (m & fh1) >> fs1 | (m & fl2) << fs2 | (m & fh2) >> fs2,
+            (t & fl1) << fs1 | (t & fh1) >> fs1 | (t & fl2) << fs2 | (t & fh2) >> fs2,
+            (tm & fl1) << fs1 | (tm & fh1) >> fs1 | (tm & fl2) << fs2 | (tm & fh2) >> fs2)
+
+    m = _mirror(bitset)
+    t = _transpose(bitset)
+    tm = _mirror(t)
+    return min(bitset, m, _flip(bitset), _flip(m), t, tm, _flip(t), _flip(tm))
+
+
+def canonicalize(bitset: int) -> tuple[int, tuple[int, ...]]:
+    '''Canonical form of a board plus the matching action remapping.
+
+    Returns (canon, remap) where canon is canonical(bitset) and remap[a]
+    is the index in MOVES on the original board that corresponds to
+    MOVES[a] on canon.
+    '''
+    m = _mirror(bitset)
+    t = _transpose(bitset)
+    tm = _mirror(t)
+    boards = (bitset, m, _flip(bitset), _flip(m), t, tm, _flip(t), _flip(tm))
+    i = min(range(8), key=boards.__getitem__)
+    return boards[i], _SYMMETRY_REMAPS[i]
+
+# Action index of a turn that ended the game, and spawn position of a turn
+# where no tile could spawn
+NO_ACTION = 0xFF
+
+
+def get_spawn(before: int, after: int) -> tuple[int, int]:
+    # Cell index and exponent of the tile that generate_tile added
+    spawned = before ^ after
+    if not spawned:
+        return NO_ACTION, 0
+    pos = (spawned.bit_length() - 1) // BITS_PER_TILE
+    return pos, spawned >> (pos * BITS_PER_TILE)
+
+def _trace_turn(prev_bs, bs, action_space, new_bs):
+    action = NO_ACTION
+    for move, succ in action_space:
+        if succ == new_bs:
+            action = MOVES.index(move)
+            break
+    return (bs, action) + get_spawn(prev_bs, bs)
+
+
+def _seed_game(seed: int) -> random.Random:
+    # AIs draw from the global random module, so it is reseeded too. The
+    # spawn stream gets a different seed, or a random AI's first draw would
+    # just repeat the first spawn's
+    random.seed(seed)
+    return random.Random(f'spawn-{seed}')
+
+_worker_game = None
+_worker_ai   = None
+_worker_max_iters = None
+_worker_traces    = False
+
+def _init_worker(shape, start_bitset, ai, max_iters, traces=False):
+    global _worker_game, _worker_ai, _worker_max_iters, _worker_traces
+    if shape != (NCOLS, BITS_PER_TILE):
+        configure(*shape)
+    _build_row_tables()
+    _worker_game = Game(to_board(start_bitset))
+    _worker_ai   = ai
+    _worker_max_iters = max_iters
+    _worker_traces    = traces
+
+def _play_seeded_game(seed):
+    # (result, trace), where trace is None unless traces were asked for
+    trace  = [] if _worker_traces else None
+    result = _worker_game.play_game(_worker_ai, _worker_max_iters, _seed_game(seed), trace=trace)
+    return result, trace
+
+
+class PhaseProfiler:
+    '''Per-phase wall time and call counts for the game loop.
+
+    Pass one as ``profiler=`` to run_game; without it the loop only pays a
+    None check per phase.
+    '''
+    def __init__(self):
+        self.phases = {}
+        self._last  = None
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        # Charges the time since the previous start/lap to `phase`
+        now   = time.perf_counter()
+        entry = self.phases.get(phase)
+        if entry is None:
+            self.phases[phase] = [1, now - self._last]
+        else:
+            entry[0] += 1
+            entry[1] += now - self._last
+        self._last = now
+
+    def as_dict(self):
+        total = sum(seconds for _, seconds in self.phases.values())
+        return {
+            phase: {
+                'calls': calls,
+                'time': seconds,
+                'time_per_call': seconds / calls,
+                'share': seconds / total if total else 0.0,
+            }
+            for phase, (calls, seconds) in self.phases.items()
+        }
+
+    def print_report(self):
+        for phase, stats in self.as_dict().items():
+            print(f'{phase}: {stats["calls"]} calls, {stats["time"]:.4f} s total, '
+                  f'{stats["time_per_call"] * 1e6:.2f} us/call, {stats["share"]:.1%} of loop time')
+
+
+class ResultStats:
+    '''Running totals over game results, updated one game at a time.
+
+    Keeps counts, sums, extremes and exact histograms of max tile and turn
+    count, so reports over any number of games take memory proportional to
+    the number of distinct values rather than the number of games.
+    '''
+    def __init__(self, game_results=()):
+        self.num_games      = 0
+        self.total_time     = 0.0
+        self.total_turns    = 0
+        self.min_turns      = None
+        self.max_turns      = None
+        self.tile_histogram  = {}
+        self.turn_histogram  = {}
+        self.depth_histogram = {}
+        for result in game_results:
+            self.add(result)
+
+    def add(self, result):
+        turns = result['num_turns_taken']
+        tile  = result['max_tile_reached']
+
+        self.num_games   += 1
+        self.total_time  += result['time_taken']
+        self.total_turns += turns
+        if self.min_turns is None or turns < self.min_turns:
+            self.min_turns = turns
+        if self.max_turns is None or turns > self.max_turns:
+            self.max_turns = turns
+        self.tile_histogram[tile]  = self.tile_histogram.get(tile, 0) + 1
+        self.turn_histogram[turns] = self.turn_histogram.get(turns, 0) + 1
+        for depth in result.get('depths', ()):
+            self.depth_histogram[depth] = self.depth_histogram.get(depth, 0) + 1
+
+    def merge(self, other):
+        self.num_games   += other.num_games
+        self.total_time  += other.total_time
+        self.total_turns += other.total_turns
+        for attr, pick in (('min_turns', min), ('max_turns', max)):
+            values = [v for v in (getattr(self, attr), getattr(other, attr)) if v is not None]
+            setattr(self, attr, pick(values) if values else None)
+        for tile, count in other.tile_histogram.items():
+            self.tile_histogram[tile] = self.tile_histogram.get(tile, 0) + count
+        for turns, count in other.turn_histogram.items():
+            self.turn_histogram[turns] = self.turn_histogram.get(turns, 0) + count
+        for depth, count in other.depth_histogram.items():
+            self.depth_histogram[depth] = self.depth_histogram.get(depth, 0) + count
+        return self
+
+    def turn_quantile(self, q: float) -> int:
+        # Nearest-rank quantile of the turn counts
+        if not self.num_games:
+            raise ValueError('no games recorded')
+        rank = max(1, math.ceil(q * self.num_games))
+        seen = 0
+        for turns in sorted(self.turn_histogram):
+            seen += self.turn_histogram[turns]
+            if seen >= rank:
+                return turns
+        return self.max_turns
+
+    def as_dict(self):
+        total_time = self.total_time
+        tiles      = self.tile_histogram
+        stats = {
+            'num_games': self.num_games,
+            'total_time': total_time,
+            'total_turns': self.total_turns,
+            'games_per_sec': self.num_games / total_time if total_time else 0.0,
+            'turns_per_sec': self.total_turns / total_time if total_time else 0.0,
+            'max_turns': self.max_turns,
+            'min_turns': self.min_turns,
+            'avg_turns': self.total_turns / self.num_games if self.num_games else 0.0,
+            'turn_quantiles': {q: self.turn_quantile(q) for q in (0.5, 0.9, 0.99)} if self.num_games else {},
+            'max_tile': max(tiles, default=None),
+            'min_tile': min(tiles, default=None),
+            'avg_max_tile': sum(t * n for t, n in tiles.items()) / self.num_games if self.num_games else 0.0,
+            'tile_histogram': dict(sorted(tiles.items())),
+        }
+        if self.depth_histogram:
+            depths = self.depth_histogram
+            stats['avg_depth'] = sum(d * n for d, n in depths.items()) / sum(depths.values())
+            stats['depth_histogram'] = dict(sorted(depths.items()))
+        return stats
 
 
 class Game:
     def __init__(self, board = None):
         if board is None:
-            self.start_board = [
-                [0, 0, 0, 0],
-                [0, 0, 0, 0],
-                [0, 0, 0, 0],
-                [0, 0, 0, 0],
-            ]
+            self.start_board = [[0] * NCOLS for _ in range(NROWS)]
         else:
             self.start_board = board
 
@@ -194,61 +671,203 @@ class Game:
                 break
             print_board(to_board(bs), f"Turn {i}: Taken action")
             
-    def run_game(self, ai, max_iters=1000000, num_games=10000):
+    def play_game(self, ai, max_iters=1000000, rng=None, profiler=None, trace=None):
+        bs = self.start_bitset
+        # Search depth per move, for AIs that report it (e.g. Expectimax)
+        depths = [] if hasattr(ai, 'last_depth') else None
+
+        start_iter = time.time()
+
+        for i in range(max_iters):
+            if profiler is not None:
+                profiler.start()
+            prev_bs = bs
+            bs = generate_tile(bs, rng)
+            if profiler is not None:
+                profiler.lap('generate_tile')
+            action_space = get_action_space(bs)
+            if profiler is not None:
+                profiler.lap('get_action_space')
+            if action_space:
+                new_bs = ai(bs, action_space)
+                if profiler is not None:
+                    profiler.lap('ai')
+                if depths is not None:
+                    depths.append(ai.last_depth)
+                if trace is not None:
+                    trace.append(_trace_turn(prev_bs, bs, action_space, new_bs))
+                bs = new_bs
+            else:
+                if trace is not None:
+                    trace.append(_trace_turn(prev_bs, bs, action_space, bs))
+                break
+
+        time_taken = time.time() - start_iter
+        result = {
+            'num_turns_taken': i,
+            'max_tile_reached': get_max_tile(bs),
+            'time_taken': time_taken,
+        }
+        if depths is not None:
+            result['depths'] = depths
+        return result
+
+    def run_game(self, ai, max_iters=1000000, num_games=10000, seed=None, profiler=None,
+                 recorder=None, stats=None, keep_results=True):
+        # With keep_results=False only the ResultStats is kept, and it is
+        # returned in place of the list of results
+        if stats is None and not keep_results:
+            stats = ResultStats()
         game_results = []
+        traces = recorder is not None and recorder.traces
 
         for game_index in range(num_games):
-            bs = self.start_bitset
-
+            rng    = None if seed is None else _seed_game(seed + game_index)
+            trace  = [] if traces else None
+            result = self.play_game(ai, max_iters, rng, profiler, trace)
+            if recorder is not None:
+                recorder.write_game(result, trace)
+            if stats is not None:
+                stats.add(result)
+            if keep_results:
+                game_results.append(result)
+
+        return (game_results if keep_results else stats), ai.__name__
+
+    def run_game_parallel(self, ai, max_iters=1000000, num_games=10000, seed=0,
+                          processes=None, chunksize=None, recorder=None, stats=None,
+                          keep_results=True):
+        # Same results as run_game(..., seed=seed), spread over a process pool.
+        # The AI is handed to the workers at pool start-up, so with the default
+        # fork start method it does not need to be picklable. A recorder gets
+        # games in game order as they come back, with traces if it wants them.
+        import multiprocessing
+
+        if stats is None and not keep_results:
+            stats = ResultStats()
+        if chunksize is None:
+            chunksize = max(1, num_games // (4 * (processes or os.cpu_count() or 1)))
+
+        with multiprocessing.Pool(
+            processes,
+            initializer=_init_worker,
+            initargs=((NCOLS, BITS_PER_TILE), self.start_bitset, ai, max_iters,
+                      recorder is not None and recorder.traces),
+        ) as pool:
+            game_results = []
+            for result, trace in pool.imap(
+                    _play_seeded_game, range(seed, seed + num_games), chunksize):
+                if recorder is not None:
+                    recorder.write_game(result, trace)
+                if stats is not None:
+                    stats.add(result)
+                if keep_results:
+                    game_results.append(result)
+
+        return (game_results if keep_results else stats), ai.__name__
+
+    def run_games_batched(self, policy, max_iters=1000000, num_games=10000, rng=None):
+        # Plays all games in lockstep on the batch engine. The policy gets the
+        # (N, NROWS) boards of the live games and an (N, 4) legal-move mask in
+        # batch.MOVES order, and returns one action index per board.
+        import numpy as np
+        import batch
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        boards    = batch.to_rows([self.start_bitset] * num_games)
+        live      = np.arange(num_games)
+        num_turns = np.full(num_games, max_iters - 1, dtype=np.int64)
+        max_tiles = np.zeros(num_games, dtype=np.int64)
+        times     = np.zeros(num_games)
+
+        for i in range(max_iters):
+            if not len(live):
+                break
             start_iter = time.time()
-
-            for i in range(max_iters):
-                bs = generate_tile(bs)
-                action_space = get_action_space(bs)
-                if action_space:
-                    bs = ai(bs, action_space)
-                else:
-                    break
-                
-            time_taken = time.time() - start_iter
-            game_results.append({
-                'num_turns_taken': i,
-                'max_tile_reached': get_max_tile(bs),
-                'time_taken': time_taken,
-            })
-
-        return game_results, ai.__name__
+            step_live  = live
+
+            boards = batch.generate_tile(boards, rng)
+            succ   = batch.successors(boards)
+            legal  = batch.legal_mask(boards, succ)
+
+            done = ~legal.any(axis=1)
+            if done.any():
+                num_turns[live[done]] = i
+                max_tiles[live[done]] = batch.get_max_tile(boards[done])
+                keep   = ~done
+                boards = boards[keep]
+                succ   = succ[keep]
+                legal  = legal[keep]
+                live   = live[keep]
+
+            if len(live):
+                actions = policy(boards, legal)
+                boards  = succ[np.arange(len(boards)), actions]
+
+            # Step time is shared by every game that was live in it
+            times[step_live] += (time.time() - start_iter) / len(step_live)
+
+        if len(live):
+            max_tiles[live] = batch.get_max_tile(boards)
+
+        game_results = [
+            {
+                'num_turns_taken': int(turns),
+                'max_tile_reached': int(tile),
+                'time_taken': float(t),
+            }
+            for turns, tile, t in zip(num_turns, max_tiles, times)
+        ]
+        return game_results, policy.__name__
         
-    def print_results(self, game_results, ai_name):
+    def print_results(self, game_results, ai_name, profiler=None):
+        # game_results is a list of results or a ResultStats
+        if not isinstance(game_results, ResultStats):
+            game_results = ResultStats(game_results)
+        stats = game_results.as_dict()
         print(f'Test: {ai_name}')
 
-        num_games = len(game_results)
         print()
-        print(f'Number of games played: {num_games}')
-        print(f'Total time taken: {sum(result["time_taken"] for result in game_results)} seconds')
-        print(f'Games per second: {num_games / sum(result["time_taken"] for result in game_results)}')
-        print(f'Turns per second: {sum(result["num_turns_taken"] for result in game_results) / sum(result["time_taken"] for result in game_results)}')
+        print(f'Number of games played: {stats["num_games"]}')
+        print(f'Total time taken: {stats["total_time"]} seconds')
+        print(f'Games per second: {stats["games_per_sec"]}')
+        print(f'Turns per second: {stats["turns_per_sec"]}')
 
         print()
-        print(f'Max number of turns before game over: {max(result["num_turns_taken"] for result in game_results)}')
-        print(f'Min number of turns before game over: {min(result["num_turns_taken"] for result in game_results)}')
-        print(f'Average number of turns before game over: {sum(result["num_turns_taken"] for result in game_results) / len(game_results)}')
+        print(f'Max number of turns before game over: {stats["max_turns"]}')
+        print(f'Min number of turns before game over: {stats["min_turns"]}')
+        print(f'Average number of turns before game over: {stats["avg_turns"]}')
+        for q, turns in stats['turn_quantiles'].items():
+            print(f'{q:.0%} of games over within: {turns} turns')
 
         print()
-        print(f'Max tile reached: {max(result["max_tile_reached"] for result in game_results)}')
-        print(f'Min tile reached: {min(result["max_tile_reached"] for result in game_results)}')
-        print(f'Average max tile reached: {sum(result["max_tile_reached"] for result in game_results) / len(game_results)}')
+        print(f'Max tile reached: {stats["max_tile"]}')
+        print(f'Min tile reached: {stats["min_tile"]}')
+        print(f'Average max tile reached: {stats["avg_max_tile"]}')
+
+        if 'avg_depth' in stats:
+            print()
+            print(f'Average search depth: {stats["avg_depth"]}')
+            print(f'Moves per search depth: {stats["depth_histogram"]}')
+
+        if profiler is not None:
+            print()
+            profiler.print_report()
 
     def plot_results(self, game_results, ai_name):
-        import pandas as pd
         import matplotlib.pyplot as plt
 
-        df = pd.DataFrame(game_results)
+        if not isinstance(game_results, ResultStats):
+            game_results = ResultStats(game_results)
 
-        plt.hist(df['max_tile_reached'], bins=100)
+        tiles = game_results.tile_histogram
+        plt.hist(list(tiles), weights=list(tiles.values()), bins=100)
         plt.title(f'Max tile reached for {ai_name}')
         plt.show()
 
-        plt.hist(df['num_turns_taken'], bins=100)
+        turns = game_results.turn_histogram
+        plt.hist(list(turns), weights=list(turns.values()), bins=100)
         plt.title(f'Number of turns before game over for {ai_name}')
         plt.show()
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+import importlib.util
+
+import game
+
+# The Tk engine lives in the repository root and is also called game.py,
+# so it is loaded under another name.
+_GUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'game.py')
+
+MOVES = {'a': game.left, 'w': game.up, 'd': game.right, 's': game.down}
+
+
+def load_gui_engine():
+    spec = importlib.util.spec_from_file_location('gui_game', _GUI_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sim_AI(ai, verbose=False, paint_every=1, headless=False):
+    '''Shows a bitset ``ai(bs, action_space)`` playing in the Tk window.'''
+    gui = load_gui_engine()
+    game._build_row_tables()
+
+    grid  = gui.Grid(game.NCOLS)
+    panel = None if headless else gui.GamePanel(grid)
+    g = gui.Game(grid, panel, verbose=verbose, paint_every=paint_every)
+    return g.sim_AI(gui.bitset_ai(ai, MOVES, game.BITS_PER_TILE))
+
+
+if __name__ == '__main__':
+    from expectimax import Expectimax
+
+    final_score = sim_AI(Expectimax(depth=2))
+    print(f"Final score: {final_score}")
@@ -0,0 +1,109 @@
+from array import array
+
+import game
+
+# Each feature scores a single row of tile exponents, higher is better.
+# Boards are scored as the sum over their rows and columns, so every
+# feature is precomputed once over all packed rows and cached on disk
+# alongside the row move tables.
+
+def _empty(tiles):
+    return tiles.count(0)
+
+def _merges(tiles):
+    compressed = [t for t in tiles if t]
+    return sum(a == b for a, b in zip(compressed, compressed[1:]))
+
+def _monotonicity(tiles):
+    inc = sum(max(0, b - a) for a, b in zip(tiles, tiles[1:]))
+    dec = sum(max(0, a - b) for a, b in zip(tiles, tiles[1:]))
+    return -min(inc, dec)
+
+def _smoothness(tiles):
+    compressed = [t for t in tiles if t]
+    return -sum(abs(a - b) for a, b in zip(compressed, compressed[1:]))
+
+FEATURES = {
+    'empty': _empty,
+    'merges': _merges,
+    'monotonicity': _monotonicity,
+    'smoothness': _smoothness,
+}
+
+DEFAULT_WEIGHTS = {
+    'empty': 2.7,
+    'merges': 1.0,
+    'monotonicity': 1.0,
+    'smoothness': 0.1,
+}
+
+# Added per row/column so boards score above a lost game (0.0)
+DEFAULT_BIAS = 200.0
+
+_FEATURE_TABLES = {}
+
+
+def feature_table(name: str):
+    key = (name, game.NCOLS, game.BITS_PER_TILE)
+    if key not in _FEATURE_TABLES:
+        feature = FEATURES[name]
+        tag     = game._source_tag(game._row_tiles, feature)
+        _FEATURE_TABLES[key] = game._row_table(
+            f'row_{name}_{tag}', 'i', lambda row: feature(game._row_tiles(row)))
+    return _FEATURE_TABLES[key]
+
+
+class Heuristic:
+    '''Weighted sum of precomputed row features.
+
+    ``weights`` maps names in FEATURES to weights. The weighted row scores
+    are folded into one table up front, so scoring a 4x4 board is 8
+    lookups: 4 rows plus 4 columns of the transposed board. A Heuristic is
+    tied to the board shape that was configured when it was created.
+    '''
+    def __init__(self, weights=None, bias=DEFAULT_BIAS):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.bias    = bias
+
+        for name in self.weights:
+            if name not in FEATURES:
+                raise ValueError(f'unknown feature {name!r}, expected one of {list(FEATURES)}')
+
+        if game.ROW_BITS > game.MAX_TABLE_BITS:
+            self.table = game._LazyRowTable(self._score_row)
+            return
+
+        values = [bias] * (1 << game.ROW_BITS)
+        for name, weight in self.weights.items():
+            if weight:
+                values = [v + weight * x for v, x in zip(values, feature_table(name))]
+        self.table = array('d', values)
+
+    def _score_row(self, row: int) -> float:
+        tiles = game._row_tiles(row)
+        return self.bias + sum(
+            weight * FEATURES[name](tiles) for name, weight in self.weights.items())
+
+    def __call__(self, bitset: int) -> float:
+        table = self.table
+        mask  = game.ROW_MASK
+        cols  = game._transpose(bitset)
+        if game.NROWS == 4:
+            _, s1, s2, s3 = game._ROW_SHIFTS
+            return (table[bitset & mask]
+                    + table[(bitset >> s1) & mask]
+                    + table[(bitset >> s2) & mask]
+                    + table[(bitset >> s3) & mask]
+                    + table[cols & mask]
+                    + table[(cols >> s1) & mask]
+                    + table[(cols >> s2) & mask]
+                    + table[(cols >> s3) & mask])
+
+        return sum(table[(b >> shift) & mask]
+                   for b in (bitset, cols) for shift in game._ROW_SHIFTS)
+
+    def features(self, bitset: int) -> dict:
+        '''Unweighted per-feature board totals, for tuning weights.'''
+        cols  = game._transpose(bitset)
+        lines = [(b >> shift) & game.ROW_MASK for b in (bitset, cols) for shift in game._ROW_SHIFTS]
+        return {name: sum(feature_table(name)[line] for line in lines) for name in FEATURES}
@@ -0,0 +1,143 @@
+import time
+import random
+
+import numpy as np
+
+import batch
+import game
+
+# Rollouts per move in the first round under a time budget; later rounds
+# are sized to fill ROUND_FILL of the remaining budget at the measured rate
+FIRST_ROUND = 4
+ROUND_FILL  = 0.75
+
+
+class MonteCarlo:
+    '''Pure Monte Carlo policy: random rollouts from every legal move.
+
+    Usable directly as a ``Game.run_game`` AI. Each move's successor is
+    played out ``rollouts`` times with uniformly random moves for up to
+    ``depth`` turns, all rollouts of all moves in lockstep on the batch
+    engine. A rollout scores the turns it survived plus the share of empty
+    cells it ended on, which breaks ties between rollouts that all survive.
+
+    With a ``time_budget`` in seconds, rollouts run in rounds: the first
+    round plays FIRST_ROUND rollouts per move, and each later round is
+    sized to fill most of the remaining budget at the rate measured by the
+    round before it; no round starts once the remaining budget is shorter
+    than the first round took. Setting ``round_size`` fixes the size of
+    every round instead, and a round is then only started if the previous
+    one would still fit. Only the first round always runs, so a decision
+    takes at most the larger of the budget and one first round (``depth``
+    batched steps over FIRST_ROUND, or ``round_size``, rollouts per move),
+    plus timing noise. Without a budget all rollouts run in one round.
+
+    Without an ``rng``, each decision seeds a fresh numpy Generator from
+    the global ``random`` module, so seeded and parallel runs of
+    ``Game.run_game`` reproduce; a given ``rng`` is used throughout.
+    '''
+    def __init__(self, rollouts=100, depth=20, time_budget=None, round_size=None, rng=None):
+        self.rollouts    = rollouts
+        self.depth       = depth
+        self.time_budget = time_budget
+        self.round_size  = round_size
+        self.rng         = rng
+        self.__name__    = f'montecarlo_k{rollouts}_d{depth}'
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.moves         = 0
+        self.rollouts_done = 0
+        self.search_time   = 0.0
+
+    def stats(self):
+        return {
+            'moves': self.moves,
+            'rollouts': self.rollouts_done,
+            'search_time': self.search_time,
+            'rollouts_per_sec': self.rollouts_done / self.search_time if self.search_time else 0.0,
+            'time_per_move': self.search_time / self.moves if self.moves else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f'Test: {self.__name__}')
+        print(f'Rollouts played: {stats["rollouts"]}')
+        print(f'Rollouts per second: {stats["rollouts_per_sec"]}')
+        print(f'Time per move: {stats["time_per_move"]}')
+
+    def __call__(self, bs, action_space):
+        start = time.perf_counter()
+        if len(action_space) == 1:
+            return action_space[0][1]
+
+        starts = batch.to_rows([new_bs for _, new_bs in action_space])
+        rng    = self._generator()
+        totals = np.zeros(len(action_space))
+        done   = 0
+
+        if self.round_size is not None:
+            size = self.round_size
+        elif self.time_budget is not None:
+            size = FIRST_ROUND
+        else:
+            size = self.rollouts
+
+        first_round = None
+        while done < self.rollouts:
+            size        = min(size, self.rollouts - done)
+            round_start = time.perf_counter()
+            totals     += self.rollout(starts, size, rng).sum(axis=1)
+            done       += size
+
+            if self.time_budget is not None:
+                now       = time.perf_counter()
+                remaining = start + self.time_budget - now
+                elapsed   = now - round_start
+                if self.round_size is None:
+                    # Every round pays a fixed per-step overhead, so stop once
+                    # not even a round as small as the first one fits
+                    if first_round is None:
+                        first_round = elapsed
+                    if remaining < first_round:
+                        break
+                    size = max(1, int(ROUND_FILL * remaining * size / elapsed))
+                elif elapsed > remaining:
+                    break
+
+        self.moves         += 1
+        self.rollouts_done += done * len(action_space)
+        self.search_time   += time.perf_counter() - start
+        return action_space[int(totals.argmax())][1]
+
+    def _generator(self):
+        if self.rng is not None:
+            return self.rng
+        return np.random.default_rng(random.getrandbits(64))
+
+    def rollout(self, starts: np.ndarray, count: int, rng=None) -> np.ndarray:
+        '''Scores of ``count`` random rollouts from each board, shape (N, count).'''
+        if rng is None:
+            rng = self._generator()
+        n     = len(starts)
+        rows  = np.repeat(starts, count, axis=0)
+        alive = np.ones(len(rows), dtype=bool)
+        turns = np.zeros(len(rows))
+        index = np.arange(len(rows))
+
+        for _ in range(self.depth):
+            rows  = batch.generate_tile(rows, rng)
+            succ  = batch.successors(rows)
+            legal = batch.legal_mask(rows, succ)
+            alive &= legal.any(axis=1)
+            if not alive.any():
+                break
+            turns += alive
+
+            # Uniform legal move per board; lost boards pick a no-op move
+            k      = (rng.random(len(rows)) * legal.sum(axis=1)).astype(np.int64)
+            action = (np.cumsum(legal, axis=1) > k[:, None]).argmax(axis=1)
+            rows   = succ[index, action]
+
+        empty = batch.get_empty_tiles(rows) / (game.NROWS * game.NCOLS + 1)
+        return (turns + empty).reshape(n, count)
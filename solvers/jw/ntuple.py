@@ -0,0 +1,288 @@
+import os
+import sys
+import mmap
+import time
+import struct
+from array import array
+
+import game
+
+# An n-tuple network scores a board as the sum of one learned weight per
+# tuple of cells, indexed by the tiles in those cells. Tuple indices are
+# the tiles' packed BITS_PER_TILE-bit fields concatenated, so each tuple
+# owns a flat block of 2^(len * BITS_PER_TILE) float32 weights. With
+# symmetric=True every tuple is also applied to the 7 rotations and
+# reflections of the board, sharing its weights.
+#
+# File layout: header, then tuple lengths and cells as bytes, zero padded
+# to WEIGHTS_ALIGN, then the flat float32 weights, little-endian. Little-
+# endian hosts map the weights in place; others load a byte-swapped copy.
+MAGIC         = b'JWNTUPLE'
+VERSION       = 1
+WEIGHTS_ALIGN = 64
+
+_HEADER = struct.Struct('<8sBBBBH')
+
+
+def default_tuples(size: int | None = None) -> list[tuple[int, ...]]:
+    '''Two row and three square 4-tuples, which with symmetry cover every
+    row, column and 2x2 square of the board.'''
+    n = game.NCOLS if size is None else size
+    if n < 4:
+        raise ValueError(f'default tuples need at least a 4x4 board, not {n}x{n}')
+    return [
+        (0, 1, 2, 3),
+        (n, n + 1, n + 2, n + 3),
+        (0, 1, n, n + 1),
+        (1, 2, n + 1, n + 2),
+        (n + 1, n + 2, 2 * n + 1, 2 * n + 2),
+    ]
+
+
+def _merge_score(tiles):
+    # Sum of the tiles created by sliding a row, the same either way
+    compressed = [t for t in tiles if t]
+    score = 0
+    i = 0
+    while i + 1 < len(compressed):
+        if compressed[i] == compressed[i + 1]:
+            score += 2 << compressed[i]
+            i += 2
+        else:
+            i += 1
+    return score
+
+_SCORE_TABLES = {}
+
+def score_table():
+    key = (game.NCOLS, game.BITS_PER_TILE)
+    if key not in _SCORE_TABLES:
+        tag = game._source_tag(game._row_tiles, _merge_score)
+        _SCORE_TABLES[key] = game._row_table(
+            f'row_score_{tag}', 'd', lambda row: _merge_score(game._row_tiles(row)))
+    return _SCORE_TABLES[key]
+
+
+def move_reward(bitset: int, action: int) -> float:
+    '''Score gained by MOVES[action] on the board, as in the original game.'''
+    table = score_table()
+    if action in (1, 3):
+        bitset = game._transpose(bitset)
+    return sum(table[(bitset >> shift) & game.ROW_MASK] for shift in game._ROW_SHIFTS)
+
+
+def _compile(cells):
+    # Runs of consecutive cells are contiguous in the bitset, so each run is
+    # one shift and mask: (source shift, mask, shift into the tuple index)
+    bits = game.BITS_PER_TILE
+    runs = []
+    dst  = 0
+    i    = 0
+    while i < len(cells):
+        j = i + 1
+        while j < len(cells) and cells[j] == cells[j - 1] + 1:
+            j += 1
+        runs.append((cells[i] * bits, (1 << ((j - i) * bits)) - 1, dst))
+        dst += (j - i) * bits
+        i = j
+    return runs
+
+
+class NTupleNetwork:
+    '''Learned afterstate evaluator over n-tuples of board cells.
+
+    Usable directly as a ``Game.run_game`` AI: picks the move maximising
+    reward plus the value of the board it leads to. ``weights`` is any
+    flat float32 buffer, a fresh zeroed ``array('f')`` by default; use
+    ``load`` to memory-map a saved network instead, which lets worker
+    processes share one read-only copy through the page cache.
+    '''
+    def __init__(self, tuples=None, symmetric=True, weights=None):
+        self.tuples    = [tuple(t) for t in (default_tuples() if tuples is None else tuples)]
+        self.symmetric = symmetric
+        self.__name__  = 'ntuple'
+
+        cells = game.NROWS * game.NCOLS
+        for t in self.tuples:
+            if not t or any(not 0 <= c < cells for c in t):
+                raise ValueError(f'tuple {t} is not a set of cells of a {game.NROWS}x{game.NCOLS} board')
+
+        self._compiled = []
+        offset = 0
+        for t in self.tuples:
+            self._compiled.append((offset, _compile(t)))
+            offset += 1 << (len(t) * game.BITS_PER_TILE)
+        self.num_weights = offset
+
+        if weights is None:
+            weights = array('f', bytes(4 * offset))
+        elif len(weights) != offset:
+            raise ValueError(f'expected {offset} weights, got {len(weights)}')
+        self.weights = weights
+
+    def _boards(self, bitset):
+        if not self.symmetric:
+            return (bitset,)
+        m  = game._mirror(bitset)
+        t  = game._transpose(bitset)
+        tm = game._mirror(t)
+        return (bitset, m, game._flip(bitset), game._flip(m),
+                t, tm, game._flip(t), game._flip(tm))
+
+    def indices(self, bitset: int) -> list[int]:
+        '''Flat weight index of every tuple on every symmetric board.'''
+        out = []
+        for b in self._boards(bitset):
+            for offset, runs in self._compiled:
+                index = offset
+                for src, mask, dst in runs:
+                    index |= ((b >> src) & mask) << dst
+                out.append(index)
+        return out
+
+    def value(self, bitset: int) -> float:
+        w = self.weights
+        total = 0.0
+        for b in self._boards(bitset):
+            for offset, runs in self._compiled:
+                index = offset
+                for src, mask, dst in runs:
+                    index |= ((b >> src) & mask) << dst
+                total += w[index]
+        return total
+
+    def evaluate(self, bs, action_space):
+        # (reward + value, reward, new_bs) of the best action
+        best = None
+        for move, new_bs in action_space:
+            reward = move_reward(bs, game.MOVES.index(move))
+            score  = reward + self.value(new_bs)
+            if best is None or score > best[0]:
+                best = (score, reward, new_bs)
+        return best
+
+    def __call__(self, bs, action_space):
+        return self.evaluate(bs, action_space)[2]
+
+    def update(self, bitset: int, delta: float) -> None:
+        w = self.weights
+        for index in self.indices(bitset):
+            w[index] += delta
+
+    def train(self, num_games=1000, learning_rate=0.0025, seed=None, stats=None,
+              start_bitset=0):
+        '''TD(0) over afterstates from self-play episodes.
+
+        Each game is played like ``Game.play_game`` with the network as
+        the AI. After each move the previous afterstate's value is moved
+        towards this move's reward plus its afterstate's value, and towards
+        0 once the game is lost. Returns a ``game.ResultStats``.
+        '''
+        if stats is None:
+            stats = game.ResultStats()
+        if isinstance(self.weights, memoryview) and self.weights.readonly:
+            raise ValueError('weights are read-only, load with writable=True to train')
+
+        for game_index in range(num_games):
+            rng   = None if seed is None else game._seed_game(seed + game_index)
+            bs    = start_bitset
+            after = None
+            turns = 0
+            start = time.time()
+            while True:
+                bs = game.generate_tile(bs, rng)
+                action_space = game.get_action_space(bs)
+                if not action_space:
+                    break
+                score, reward, new_bs = self.evaluate(bs, action_space)
+                if after is not None:
+                    self.update(after, learning_rate * (score - self.value(after)))
+                after, bs = new_bs, new_bs
+                turns += 1
+
+            if after is not None:
+                self.update(after, -learning_rate * self.value(after))
+            stats.add({
+                'num_turns_taken': turns,
+                'max_tile_reached': game.get_max_tile(bs),
+                'time_taken': time.time() - start,
+            })
+        return stats
+
+    def save(self, path):
+        '''Writes the network atomically, so a running reader never maps a
+        half-written file.'''
+        header = _HEADER.pack(MAGIC, VERSION, game.BITS_PER_TILE, game.NCOLS,
+                              self.symmetric, len(self.tuples))
+        for t in self.tuples:
+            header += bytes((len(t),) + t)
+        header += bytes(-len(header) % WEIGHTS_ALIGN)
+
+        weights = self.weights
+        if sys.byteorder != 'little':
+            weights = array('f', weights)
+            weights.byteswap()
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(weights)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, writable=False):
+        '''Memory-maps a saved network. Read-only by default; with
+        ``writable`` the mapping is copy-on-write, so the network can be
+        trained further without touching the file.'''
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+
+        magic, version, bits_per_tile, ncols, symmetric, num_tuples = _HEADER.unpack_from(mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} n-tuple network')
+        if (bits_per_tile, ncols) != (game.BITS_PER_TILE, game.NCOLS):
+            raise ValueError(
+                f'{path} is for {ncols}x{ncols} boards with {bits_per_tile}-bit tiles, but the '
+                f'engine is configured for {game.NCOLS}x{game.NCOLS} with {game.BITS_PER_TILE}')
+
+        offset = _HEADER.size
+        tuples = []
+        for _ in range(num_tuples):
+            length = mm[offset]
+            tuples.append(tuple(mm[offset + 1:offset + 1 + length]))
+            offset += 1 + length
+        offset += -offset % WEIGHTS_ALIGN
+
+        weights = memoryview(mm)[offset:].cast('f')
+        if sys.byteorder != 'little':
+            weights = array('f', weights)
+            weights.byteswap()
+        return cls(tuples, bool(symmetric), weights)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train an n-tuple network by TD self-play')
+    parser.add_argument('path', help='network file, resumed from if it exists')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--report-every', type=int, default=1000)
+    parser.add_argument('--learning-rate', type=float, default=0.0025)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    game._build_row_tables()
+    if os.path.exists(args.path):
+        net = NTupleNetwork.load(args.path, writable=True)
+    else:
+        net = NTupleNetwork()
+
+    played = 0
+    while played < args.games:
+        chunk = min(args.report_every, args.games - played)
+        seed  = None if args.seed is None else args.seed + played
+        stats = net.train(chunk, args.learning_rate, seed).as_dict()
+        played += chunk
+        print(f'{played} games: average turns {stats["avg_turns"]:.1f}, '
+              f'average max tile {stats["avg_max_tile"]:.1f}, tiles {stats["tile_histogram"]}')
+        net.save(args.path)
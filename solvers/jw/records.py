@@ -0,0 +1,153 @@
+import os
+import struct
+
+import game
+
+# File layout
+#   header: MAGIC, then version, BITS_PER_TILE, NCOLS, NROWS as bytes
+#   chunks: CHUNK_MAGIC, number of games, payload length, then per game a
+#           summary and `trace_len` turns of (board, action, spawn pos/value)
+#
+# Chunks are written whole and flushed, so a crashed run loses at most the
+# chunk in progress and readers stop cleanly at a truncated tail.
+MAGIC       = b'JW2048RC'
+VERSION     = 1
+CHUNK_MAGIC = b'CHNK'
+NO_ACTION   = game.NO_ACTION
+
+_HEADER  = struct.Struct('<8sBBBB')
+_CHUNK   = struct.Struct('<4sII')
+_SUMMARY = struct.Struct('<QIQdI')
+_TURN    = struct.Struct('<BBB')
+
+
+def _board_bytes(bits_per_tile, ncols, nrows):
+    return (bits_per_tile * ncols * nrows + 7) // 8
+
+
+class GameRecorder:
+    '''Streams per-game summaries, and optionally per-turn traces, to disk.
+
+    Pass as ``recorder=`` to ``Game.run_game``. Games are buffered and
+    written as one chunk every ``chunk_games`` games, so memory stays
+    bounded however long the run is.
+    '''
+    def __init__(self, path, traces=False, chunk_games=1024):
+        self.path        = path
+        self.traces      = traces
+        self.chunk_games = chunk_games
+        self.num_games   = 0
+        self.board_bytes = _board_bytes(game.BITS_PER_TILE, game.NCOLS, game.NROWS)
+
+        self._buffer       = bytearray()
+        self._buffer_games = 0
+        self._file         = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, game.BITS_PER_TILE, game.NCOLS, game.NROWS))
+        self._file.flush()
+
+    def write_game(self, result, trace=None):
+        trace = trace or ()
+        self._buffer += _SUMMARY.pack(
+            self.num_games, result['num_turns_taken'], result['max_tile_reached'],
+            result['time_taken'], len(trace))
+
+        nbytes = self.board_bytes
+        for board, action, spawn_pos, spawn_val in trace:
+            self._buffer += board.to_bytes(nbytes, 'little')
+            self._buffer += _TURN.pack(action, spawn_pos, spawn_val)
+
+        self.num_games     += 1
+        self._buffer_games += 1
+        if self._buffer_games >= self.chunk_games:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer_games:
+            return
+        self._file.write(_CHUNK.pack(CHUNK_MAGIC, self._buffer_games, len(self._buffer)))
+        self._file.write(self._buffer)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+        self._buffer_games = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_games(path, traces=True):
+    '''Yields recorded games one at a time, reading one chunk at a time.
+
+    Each game is a run_game-style result dict with ``game_index`` and, if
+    ``traces``, a ``trace`` list of (board, action, spawn_pos, spawn_val).
+    '''
+    with open(path, 'rb') as f:
+        magic, version, bits_per_tile, ncols, nrows = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} game record file')
+        nbytes    = _board_bytes(bits_per_tile, ncols, nrows)
+        turn_size = nbytes + _TURN.size
+
+        while True:
+            head = f.read(_CHUNK.size)
+            if len(head) < _CHUNK.size:
+                return
+            chunk_magic, num_games, length = _CHUNK.unpack(head)
+            payload = f.read(length)
+            if chunk_magic != CHUNK_MAGIC or len(payload) < length:
+                # Torn write from an interrupted run
+                return
+
+            offset = 0
+            for _ in range(num_games):
+                index, turns, max_tile, time_taken, trace_len = _SUMMARY.unpack_from(payload, offset)
+                offset += _SUMMARY.size
+
+                result = {
+                    'game_index': index,
+                    'num_turns_taken': turns,
+                    'max_tile_reached': max_tile,
+                    'time_taken': time_taken,
+                }
+                if traces:
+                    trace = []
+                    for turn in range(trace_len):
+                        start = offset + turn * turn_size
+                        board = int.from_bytes(payload[start:start + nbytes], 'little')
+                        trace.append((board, *_TURN.unpack_from(payload, start + nbytes)))
+                    result['trace'] = trace
+                offset += trace_len * turn_size
+                yield result
+
+
+def aggregate(path):
+    '''game.ResultStats over a record file, in a single streaming pass.'''
+    stats = game.ResultStats()
+    for result in read_games(path, traces=False):
+        stats.add(result)
+    return stats
+
+
+def replay(trace, start_bitset=0):
+    '''Rebuilds a game's boards from its recorded spawns and actions alone.
+
+    Yields (board, action) per turn and raises ValueError if the result
+    ever disagrees with the recorded board.
+    '''
+    bs = start_bitset
+    for board, action, spawn_pos, spawn_val in trace:
+        if spawn_pos != NO_ACTION:
+            bs |= spawn_val << (spawn_pos * game.BITS_PER_TILE)
+        if bs != board:
+            raise ValueError('trace does not replay: board mismatch')
+        yield bs, action
+        if action != NO_ACTION:
+            bs = game.MOVES[action](bs)
@@ -0,0 +1,191 @@
+import os
+import time
+import queue as queue_module
+import struct
+import multiprocessing
+
+import game
+import records
+from ntuple import move_reward
+
+# Self-play transitions (board, action, reward, next_board, done), where
+# board is what the policy saw, action its index in game.MOVES, reward the
+# score the move gained, next_board the board after the move and the next
+# spawn, and done whether next_board has no legal move.
+#
+# File layout: header, then fixed-size little-endian transition records,
+# so any prefix of whole records is a valid file.
+MAGIC   = b'JW2048TR'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sBBBB')
+_FIELDS = struct.Struct('<BfB')
+
+CHUNK_TRANSITIONS = 4096
+
+
+def record_size(board_bytes: int) -> int:
+    return 2 * board_bytes + _FIELDS.size
+
+
+def _pack(board_bytes, bs, action, reward, next_bs, done):
+    return (bs.to_bytes(board_bytes, 'little')
+            + next_bs.to_bytes(board_bytes, 'little')
+            + _FIELDS.pack(action, reward, done))
+
+
+def _worker(shape, start_bitset, policy, max_iters, games, chunk_transitions, queue):
+    # Plays the given seeded games and puts whole chunks of packed
+    # transitions on the queue, blocking while it is full
+    if shape != (game.NCOLS, game.BITS_PER_TILE):
+        game.configure(*shape)
+    game._build_row_tables()
+
+    nbytes = records._board_bytes(game.BITS_PER_TILE, game.NCOLS, game.NROWS)
+    chunk  = bytearray()
+    count  = 0
+    turns  = 0
+    for seed in games:
+        rng   = game._seed_game(seed)
+        bs    = game.generate_tile(start_bitset, rng)
+        space = game.get_action_space(bs)
+        for _ in range(max_iters):
+            if not space:
+                break
+            new_bs  = policy(bs, space)
+            action  = next(game.MOVES.index(move) for move, succ in space if succ == new_bs)
+            next_bs = game.generate_tile(new_bs, rng)
+            space   = game.get_action_space(next_bs)
+
+            chunk += _pack(nbytes, bs, action, move_reward(bs, action), next_bs, not space)
+            count += 1
+            turns += 1
+            bs = next_bs
+            if count == chunk_transitions:
+                queue.put(bytes(chunk))
+                chunk.clear()
+                count = 0
+
+    if chunk:
+        queue.put(bytes(chunk))
+    queue.put(('done', len(games), turns))
+
+
+def generate(policy, path, num_games=1000, processes=None, seed=0, max_iters=1000000,
+             chunk_transitions=CHUNK_TRANSITIONS, queue_chunks=None, start_bitset=0):
+    '''Plays seeded games in worker processes and streams their transitions
+    to ``path``.
+
+    Game i is seeded with seed + i, as in ``Game.run_game``. Workers send
+    chunks of ``chunk_transitions`` packed records through a queue holding
+    at most ``queue_chunks`` chunks (two per worker by default); a full
+    queue blocks the workers, so memory stays bounded when the writer
+    falls behind. Records from different workers are interleaved by chunk.
+    As with ``run_game_parallel`` the policy is handed to the workers at
+    start-up, so with the fork start method it need not be picklable.
+    '''
+    processes = processes or os.cpu_count() or 1
+    queue = multiprocessing.Queue(queue_chunks or 2 * processes)
+    shape = (game.NCOLS, game.BITS_PER_TILE)
+
+    workers = [
+        multiprocessing.Process(
+            target=_worker, daemon=True,
+            args=(shape, start_bitset, policy, max_iters,
+                  range(seed + w, seed + num_games, processes), chunk_transitions, queue))
+        for w in range(processes)
+    ]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    games = transitions = 0
+    running = len(workers)
+    try:
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, game.BITS_PER_TILE, game.NCOLS, game.NROWS))
+            while running:
+                try:
+                    item = queue.get(timeout=1.0)
+                except queue_module.Empty:
+                    # A crashed worker never sends its done message
+                    failed = [w.exitcode for w in workers if w.exitcode not in (None, 0)]
+                    if failed:
+                        raise RuntimeError(f'self-play worker exited with code {failed[0]}')
+                    continue
+                if isinstance(item, tuple):
+                    running     -= 1
+                    games       += item[1]
+                    transitions += item[2]
+                else:
+                    f.write(item)
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'games': games,
+        'transitions': transitions,
+        'seconds': elapsed,
+        'transitions_per_sec': transitions / elapsed if elapsed else 0.0,
+        'bytes': os.path.getsize(path),
+    }
+
+
+def read_transitions(path, chunk_transitions=CHUNK_TRANSITIONS):
+    '''Yields (board, action, reward, next_board, done) tuples, reading
+    ``chunk_transitions`` records at a time.'''
+    with open(path, 'rb') as f:
+        magic, version, bits_per_tile, ncols, nrows = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} transition file')
+        nbytes = records._board_bytes(bits_per_tile, ncols, nrows)
+        size   = record_size(nbytes)
+
+        while data := f.read(size * chunk_transitions):
+            # A torn last record from an interrupted run is dropped
+            for offset in range(0, len(data) - size + 1, size):
+                bs      = int.from_bytes(data[offset:offset + nbytes], 'little')
+                next_bs = int.from_bytes(data[offset + nbytes:offset + 2 * nbytes], 'little')
+                action, reward, done = _FIELDS.unpack_from(data, offset + 2 * nbytes)
+                yield bs, action, reward, next_bs, bool(done)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate self-play transitions in parallel')
+    parser.add_argument('out', help='transition file to write')
+    parser.add_argument('--policy', choices=('noskill', 'min_empty', 'expectimax', 'ntuple'),
+                        default='noskill')
+    parser.add_argument('--network', help='n-tuple network file, for --policy ntuple')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=CHUNK_TRANSITIONS,
+                        help='transitions per chunk sent to the writer')
+    parser.add_argument('--queue', type=int, default=None, help='max chunks in flight')
+    args = parser.parse_args()
+
+    game._build_row_tables()
+    if args.policy == 'noskill':
+        from benchmark import noskill as policy
+    elif args.policy == 'min_empty':
+        from benchmark import naive_minimize_empty_tiles as policy
+    elif args.policy == 'expectimax':
+        from expectimax import Expectimax
+        policy = Expectimax(depth=2)
+    else:
+        from ntuple import NTupleNetwork
+        policy = NTupleNetwork.load(args.network) if args.network else NTupleNetwork()
+
+    stats = generate(policy, args.out, args.games, args.processes, args.seed,
+                     chunk_transitions=args.chunk, queue_chunks=args.queue)
+    print(f'Games played: {stats["games"]}')
+    print(f'Transitions: {stats["transitions"]} ({stats["bytes"]} bytes)')
+    print(f'Transitions per second: {stats["transitions_per_sec"]}')
@@ -0,0 +1,260 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+
+import numpy as np
+
+import game
+import batch
+from heuristic import Heuristic
+
+# Line protocol, one request per line and one reply per request, in order:
+#   <board as hex>   ->  <action index in MOVES> <new board as hex>
+#   stats            ->  JSON latency and batching metrics
+# A request that cannot be answered gets a line starting with "error".
+# A board with no legal move gets game.NO_ACTION and the board unchanged.
+DEFAULT_PORT = 2048
+
+
+def _percentile(values, q):
+    # Nearest-rank percentile of an already sorted sequence
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))]
+
+
+class DecisionServer:
+    '''Best-move service over TCP or a Unix socket.
+
+    Requests from all connections go through one queue and are answered in
+    micro-batches of up to ``max_batch`` boards: a batch is closed when it
+    is full or ``max_delay`` seconds after its first request arrived.
+    ``policy`` is a batch-engine policy taking (N, NROWS) boards and an
+    (N, 4) legal mask, by default ``batch.greedy_policy(Heuristic())``.
+    The last ``window`` request latencies are kept for the stats.
+    '''
+    def __init__(self, policy=None, max_batch=256, max_delay=0.002, window=100000):
+        game._build_row_tables()
+        self.policy    = policy or batch.greedy_policy(Heuristic())
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.latencies = deque(maxlen=window)
+        self.requests  = 0
+        self.batches   = 0
+        self.errors    = 0
+        self._queue    = None
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'latency_p50': _percentile(latencies, 0.5),
+            'latency_p99': _percentile(latencies, 0.99),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+    def decide(self, bitsets):
+        '''Actions and successor boards for a list of boards, in one batch.'''
+        rows   = batch.to_rows(bitsets)
+        succ   = batch.successors(rows)
+        legal  = batch.legal_mask(rows, succ)
+        action = self.policy(rows, legal)
+
+        index  = np.arange(len(rows))
+        chosen = batch.to_bitsets(succ[index, action])
+        return [(int(a), new_bs) if can else (game.NO_ACTION, bs)
+                for a, new_bs, can, bs in zip(action, chosen, legal.any(axis=1), bitsets)]
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending  = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = self.decide([bs for bs, _, _ in pending])
+            except Exception as exc:
+                # Fail this batch only, the batcher keeps serving
+                self.errors += len(pending)
+                for _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, arrived), result in zip(pending, results):
+                self.latencies.append(now - arrived)
+                if not future.done():
+                    future.set_result(result)
+            self.requests += len(pending)
+            self.batches  += 1
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while line := (await reader.readline()).strip():
+                if line == b'stats':
+                    writer.write(json.dumps(self.stats()).encode() + b'\n')
+                else:
+                    try:
+                        bs = int(line, 16)
+                    except ValueError:
+                        bs = -1
+                    if not 0 <= bs < 1 << (game.NROWS * game.ROW_BITS):
+                        writer.write(b'error bad board\n')
+                    else:
+                        future = loop.create_future()
+                        await self._queue.put((bs, future, time.perf_counter()))
+                        try:
+                            action, new_bs = await future
+                        except Exception as exc:
+                            writer.write(f'error {type(exc).__name__}: {exc}\n'.encode())
+                        else:
+                            writer.write(f'{action} {new_bs:x}\n'.encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        self._queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batcher())
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+class DecisionClient:
+    '''Blocking client for a DecisionServer.'''
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        import socket
+
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile('rwb')
+
+    def _request(self, line: bytes) -> bytes:
+        self.file.write(line + b'\n')
+        self.file.flush()
+        return self.file.readline().strip()
+
+    def best_move(self, bitset: int) -> tuple[int, int]:
+        '''(action index in game.MOVES, new board) for a packed board.'''
+        reply = self._request(f'{bitset:x}'.encode())
+        if reply.startswith(b'error'):
+            raise RuntimeError(reply.decode())
+        action, new_bs = reply.split()
+        return int(action), int(new_bs, 16)
+
+    def stats(self) -> dict:
+        return json.loads(self._request(b'stats'))
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def load_test(connections=32, requests=1000, host='127.0.0.1', port=DEFAULT_PORT,
+                    path=None, seed=0):
+    '''Plays random mid-game boards from concurrent connections.
+
+    Returns client-side throughput and latency percentiles, plus the
+    server's own stats.
+    '''
+    rng    = random.Random(seed)
+    boards = [game.to_bitset([[rng.choice((0, 0, 1, 1, 2, 3, 4, 5, 6, 7)) for _ in range(game.NCOLS)]
+                              for _ in range(game.NROWS)])
+              for _ in range(requests)]
+    latencies = []
+
+    async def open_connection():
+        if path is not None:
+            return await asyncio.open_unix_connection(path)
+        return await asyncio.open_connection(host, port)
+
+    async def connection(share):
+        reader, writer = await open_connection()
+        for bs in share:
+            start = time.perf_counter()
+            writer.write(f'{bs:x}\n'.encode())
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(boards[i::connections]) for i in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    # Over the event loop too, as the server may be running on this loop
+    reader, writer = await open_connection()
+    writer.write(b'stats\n')
+    await writer.drain()
+    server_stats = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'connections': connections,
+        'requests_per_sec': requests / elapsed,
+        'latency_p50': _percentile(latencies, 0.5),
+        'latency_p99': _percentile(latencies, 0.99),
+        'server': server_stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Best-move decision service')
+    parser.add_argument('command', choices=('serve', 'load'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help='serve on / connect to this Unix socket path instead')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay', type=float, default=0.002, help='seconds')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = DecisionServer(max_batch=args.max_batch, max_delay=args.max_delay)
+        print(f'Serving on {args.unix or f"{args.host}:{args.port}"}')
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(load_test(
+            args.connections, args.requests, args.host, args.port, args.unix)), indent=2))